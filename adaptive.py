@@ -0,0 +1,220 @@
+##############################################################################
+# This software is licensed under a modified MIT license. The MIT license itself
+# is unchanged, we have only added an optional beerware clause (based off of
+# Poul-Henning Kamp's Beerware license). That is to say, you have the option
+# of completely disregarding the beerware clause and using this software under
+# the vanilla MIT license if you so wish.
+#
+# Copyright (c) 2013 Chris Gibson
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
+# Optional beerware clause:
+# If we happen to meet in person someday and you think this software is worth
+# it, you are welcome to buy us a round of beers. This clause is entirely
+# optional, and need not be fulfilled for you to fully comply with the terms
+# of this license.
+##############################################################################
+
+import math
+
+import numpy as np
+
+from refine import WEIGHTS, groupBy
+
+
+# Adaptive catmull-clark subdivision.
+#
+# Only faces whose error is over a tolerance are refined, or every face when the
+# tolerance is 0. A face's error is how far its edge points would move off its
+# edges, the largest of |edge point - edge midpoint| over its edges. That is
+# zero on flat regions and grows with curvature. Given a camera, the error is
+# measured in pixels instead.
+#
+# Refined faces split into quads as usual. Faces next to them get points on
+# the edges they share, so they are split too: their corners and edge points
+# are joined to a face point, two at a time, which leaves one triangle when
+# the count is odd. Every edge point is shared by the faces on both sides, so
+# the result has no cracks or T-junctions.
+#
+# Triangles are stored as quads whose last corner repeats the third, which the
+# rest of the code can draw and export as-is. Meshes holding them can be
+# refined adaptively again, but not uniformly.
+
+
+# Return the (F, 4) mask of the distinct corners of every face
+def cornerMask(quads):
+    valid = np.ones(quads.shape, dtype=bool)
+    valid[:, 3] = quads[:, 3] != quads[:, 2]
+    return valid
+
+
+# Return the pixels per unit length at unit distance of a camera given as
+# (eye, fovy in degrees, viewport height in pixels)
+def _pixelScale(fovy, height):
+    return height / (2.0 * math.tan(math.radians(fovy) / 2.0))
+
+
+# Refine an (N, 3) vertex array and (F, 4) quads by one adaptive level.
+# Returns the refined vertices and quads
+def refineAdaptive(verts, quads, tolerance, camera=None, technique=2):
+    verts = np.asarray(verts, dtype=np.float64)
+    quads = np.asarray(quads, dtype=np.int64).reshape(-1, 4)
+    vertexCount = len(verts)
+    faceCount = len(quads)
+
+    valid = cornerMask(quads)
+    cornerCount = valid.sum(axis=1)
+
+    # Face points for every face
+    facePts = (verts[quads] * valid[:, :, None]).sum(axis=1) / cornerCount[:, None]
+
+    # Number the edges in order of first appearance, skipping the repeated
+    # corner of triangles
+    heStart = quads.ravel()
+    heEnd = np.roll(quads, -1, axis=1).ravel()
+    heValid = np.nonzero(heStart != heEnd)[0]
+    lo = np.minimum(heStart, heEnd)[heValid]
+    hi = np.maximum(heStart, heEnd)[heValid]
+
+    _, first, inverse, counts = np.unique(lo * vertexCount + hi, return_index=True,
+                                          return_inverse=True, return_counts=True)
+    if np.any(counts != 2):
+        raise ValueError("mesh is not closed: every edge must border exactly two faces")
+
+    order = np.argsort(first, kind='mergesort')
+    rank = np.empty_like(order)
+    rank[order] = np.arange(len(order))
+
+    halfEdges = np.full(4 * faceCount, -1, dtype=np.int64)
+    halfEdges[heValid] = rank[inverse.ravel()]
+    edges = np.column_stack([lo[first[order]], hi[first[order]]])
+    edgeCount = len(edges)
+
+    byEdge, _ = groupBy(halfEdges[heValid], edgeCount)
+    edgeFaces = (heValid[byEdge] // 4).reshape(-1, 2)
+
+    # Edge points for every edge, and how far each lies off its edge
+    ends = verts[edges[:, 0]] + verts[edges[:, 1]]
+    edgePts = (ends + facePts[edgeFaces[:, 0]] + facePts[edgeFaces[:, 1]]) / 4.0
+    deviation = np.sqrt(((edgePts - ends / 2.0) ** 2).sum(axis=1))
+
+    # Pick the faces to refine
+    heDeviation = np.zeros(4 * faceCount)
+    heDeviation[heValid] = deviation[halfEdges[heValid]]
+    faceError = heDeviation.reshape(-1, 4).max(axis=1)
+
+    if camera is not None:
+        eye, fovy, height = camera
+        distance = np.sqrt(((facePts - np.asarray(eye, dtype=np.float64)) ** 2).sum(axis=1))
+        faceError *= _pixelScale(fovy, height) / np.maximum(distance, 1e-12)
+
+    # A tolerance of 0 refines every face, flat ones included
+    if tolerance <= 0:
+        refined = np.ones(faceCount, dtype=bool)
+    else:
+        refined = faceError > tolerance
+
+    # Split every edge of a refined face. Faces with a split edge need a face point
+    splitEdge = np.zeros(edgeCount, dtype=bool)
+    splitEdge[halfEdges.reshape(-1, 4)[refined[:, None] & valid]] = True
+
+    heSplit = np.zeros(4 * faceCount, dtype=bool)
+    heSplit[heValid] = splitEdge[halfEdges[heValid]]
+    heSplit = heSplit.reshape(-1, 4)
+    changed = heSplit.any(axis=1)
+
+    # Move the old vertices that are surrounded by refined faces
+    cornerVerts = quads[valid]
+    cornerFaces = np.nonzero(valid)[0]
+    faceValence = np.bincount(cornerVerts, minlength=vertexCount)
+    refinedValence = np.bincount(cornerVerts[refined[cornerFaces]], minlength=vertexCount)
+    interior = (faceValence > 0) & (refinedValence == faceValence)
+
+    faceSum = np.zeros_like(verts)
+    np.add.at(faceSum, cornerVerts, facePts[cornerFaces])
+    edgeSum = np.zeros_like(verts)
+    np.add.at(edgeSum, edges[:, 0], edgePts)
+    np.add.at(edgeSum, edges[:, 1], edgePts)
+    edgeValence = np.bincount(edges.ravel(), minlength=vertexCount)
+
+    n = faceValence[interior].astype(np.float64)[:, None]
+    w1, w2, w3 = WEIGHTS[technique](n)
+
+    newVerts = verts.copy()
+    newVerts[interior] = (w1 * verts[interior] +
+                          w2 * (faceSum[interior] / n) +
+                          w3 * (edgeSum[interior] / edgeValence[interior][:, None]))
+
+    # Number the new points: face points of changed faces, then split edge points
+    facePtIdx = np.full(faceCount, -1, dtype=np.int64)
+    facePtIdx[changed] = vertexCount + np.arange(changed.sum())
+    edgePtIdx = np.full(edgeCount, -1, dtype=np.int64)
+    edgePtIdx[splitEdge] = vertexCount + changed.sum() + np.arange(splitEdge.sum())
+
+    newVerts = np.concatenate([newVerts, facePts[changed], edgePts[splitEdge]])
+
+    # Walk the boundary of every changed face: corner, edge point if split,
+    # next corner and so on
+    ring = np.full((changed.sum(), 8), -1, dtype=np.int64)
+    ring[:, 0::2] = np.where(valid[changed], quads[changed], -1)
+    changedHalfEdges = halfEdges.reshape(-1, 4)[changed]
+    ring[:, 1::2] = np.where(heSplit[changed], edgePtIdx[changedHalfEdges], -1)
+
+    isEdgePt = np.zeros(ring.shape, dtype=bool)
+    isEdgePt[:, 1::2] = heSplit[changed]
+
+    # Close up the gaps
+    compact = np.argsort(ring < 0, axis=1, kind='mergesort')
+    ring = np.take_along_axis(ring, compact, axis=1)
+    isEdgePt = np.take_along_axis(isEdgePt, compact, axis=1)
+    ringLength = (ring >= 0).sum(axis=1)
+
+    # Start every ring on its last edge point, so a fully split quad gives the
+    # same four quads, in the same order, as uniform subdivision
+    ringStart = np.where(isEdgePt, np.arange(8), -1).max(axis=1)
+    changedFaces = np.nonzero(changed)[0]
+
+    children = [quads[~changed]]
+    childFaces = [np.nonzero(~changed)[0]]
+    childOrder = [np.zeros((~changed).sum(), dtype=np.int64)]
+
+    for length in np.unique(ringLength):
+        rows = np.nonzero(ringLength == length)[0]
+        pos = (ringStart[rows, None] + np.arange(length)) % length
+        r = np.take_along_axis(ring[rows], pos, axis=1)
+        center = facePtIdx[changedFaces[rows]]
+
+        for j in range(length // 2):
+            children.append(np.column_stack([center, r[:, 2 * j], r[:, 2 * j + 1],
+                                             r[:, (2 * j + 2) % length]]))
+            childFaces.append(changedFaces[rows])
+            childOrder.append(np.full(len(rows), j, dtype=np.int64))
+
+        if length % 2:
+            children.append(np.column_stack([center, r[:, length - 1], r[:, 0], r[:, 0]]))
+            childFaces.append(changedFaces[rows])
+            childOrder.append(np.full(len(rows), length // 2, dtype=np.int64))
+
+    # Keep the children of every face together, in face order
+    childFaces = np.concatenate(childFaces)
+    childOrder = np.concatenate(childOrder)
+    newQuads = np.concatenate(children)[np.lexsort((childOrder, childFaces))]
+
+    return newVerts, newQuads
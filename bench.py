@@ -0,0 +1,237 @@
+# Benchmarks for the subdivision code.
+#
+#   python bench.py suite [--max-level 7] [--max-quads 2000000] [--output results.json]
+#                         [--baseline baseline.json] [--threshold 0.2] [--min-seconds 0.001]
+#   python bench.py parallel [--level 6] [--levels 1] [--workers 8]
+#
+# suite: times SubdMesh.subdivide (per engine), toFloatArray, spherize and
+# buildCube on the cube and on torus cages of increasing size, for levels 1 up
+# to --max-level, skipping levels with more than --max-quads quads. Every case
+# reports its best wall time, peak traced memory and vertices per second.
+# --output writes the results as JSON, and --baseline compares against such a
+# file, exiting with status 1 when any case got more than --threshold slower
+# and at least --min-seconds slower. The second bound keeps timer noise on
+# cases that take well under a millisecond from counting as regressions.
+#
+# parallel: builds a cube subdivided to the given level and times --levels more
+# levels with the parallel engine for 1 up to the given number of workers,
+# against the serial numpy engine. Each worker count starts its pool once and
+# keeps it over the repeats.
+##############################################################################
+
+import argparse
+import json
+import math
+import multiprocessing
+import sys
+import time
+
+import numpy as np
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+from mesh import SubdMesh
+from parallel import subdivideParallel
+from refine import Refinement
+
+
+# Return the (verts, quads) arrays of a cube subdivided to the given level
+def cubeArrays(level):
+    verts = SubdMesh.buildCube().vertexArray()
+    quads = SubdMesh.buildCube().quadArray()
+    for i in range(level):
+        refinement = Refinement(quads, len(verts))
+        verts = refinement.apply(verts)
+        quads = refinement.refinedQuads()
+    return verts, quads
+
+
+# Return the (verts, quads) arrays of a closed torus cage with the given number
+# of rings around the tube and sides around each ring
+def torusArrays(rings, sides, radius=1.0, tube=0.4):
+    u = 2 * math.pi * np.arange(rings) / rings
+    v = 2 * math.pi * np.arange(sides) / sides
+    u, v = np.meshgrid(u, v, indexing='ij')
+
+    r = radius + tube * np.cos(v)
+    verts = np.stack([r * np.cos(u), tube * np.sin(v), r * np.sin(u)], axis=-1).reshape(-1, 3)
+
+    i, j = np.meshgrid(np.arange(rings), np.arange(sides), indexing='ij')
+    i2 = (i + 1) % rings
+    j2 = (j + 1) % sides
+    quads = np.stack([i * sides + j, i * sides + j2, i2 * sides + j2, i2 * sides + j], axis=-1)
+    return verts, quads.reshape(-1, 4)
+
+
+# Return the best wall time of the given number of runs of fn. setup is run
+# untimed before every run and its result is passed to fn
+def bestTime(fn, repeat, setup=lambda: None):
+    best = None
+    for i in range(repeat):
+        arg = setup()
+        start = time.time()
+        fn(arg)
+        elapsed = time.time() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+# Return the peak traced memory in bytes of one run of fn, or None when
+# tracemalloc is not available
+def peakMemory(fn, setup=lambda: None):
+    if tracemalloc is None:
+        return None
+
+    arg = setup()
+    tracemalloc.start()
+    try:
+        fn(arg)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+# Return the cases of the suite as (name, setup, fn, vertex count) tuples.
+# Every setup builds a fresh mesh, as some operations change the mesh
+def suiteCases(maxLevel, maxQuads, pythonMaxQuads):
+    cages = [('cube', SubdMesh.buildCube().vertexArray(), SubdMesh.buildCube().quadArray())]
+    for size in (8, 32, 128):
+        verts, quads = torusArrays(size, size)
+        cages.append(('torus%d' % size, verts, quads))
+
+    cases = [('buildCube', lambda: None, lambda arg: SubdMesh.buildCube(), 8)]
+
+    for cageName, cageVerts, cageQuads in cages:
+        verts, quads = cageVerts, cageQuads
+        for level in range(1, maxLevel + 1):
+            if len(quads) * 4 > maxQuads:
+                break
+
+            before = (verts, quads)
+            refinement = Refinement(quads, len(verts))
+            verts = refinement.apply(verts)
+            quads = refinement.refinedQuads()
+
+            def coarse(before=before):
+                return SubdMesh.fromArrays(*before)
+
+            def fine(after=(verts, quads)):
+                return SubdMesh.fromArrays(*after)
+
+            tag = '%s L%d' % (cageName, level)
+            engines = ['numpy']
+            if len(quads) <= pythonMaxQuads:
+                engines.insert(0, 'python')
+
+            for engine in engines:
+                cases.append(('subdivide[%s] %s' % (engine, tag), coarse,
+                              lambda mesh, engine=engine: mesh.subdivide(engine=engine),
+                              len(verts)))
+
+            cases.append(('toFloatArray %s' % tag, fine, lambda mesh: mesh.toFloatArray(), len(verts)))
+            cases.append(('spherize %s' % tag, fine, lambda mesh: mesh.spherize(), len(verts)))
+
+    return cases
+
+
+def benchSuite(args):
+    results = []
+    for name, setup, fn, vertexCount in suiteCases(args.max_level, args.max_quads, args.python_max_quads):
+        seconds = bestTime(fn, args.repeat, setup)
+        result = {
+            'name': name,
+            'seconds': seconds,
+            'peakBytes': peakMemory(fn, setup),
+            'vertices': vertexCount,
+            'verticesPerSecond': vertexCount / seconds if seconds > 0 else None,
+        }
+        results.append(result)
+
+        sys.stdout.write("%-32s %10.4fs %12s %14s\n" % (
+            name, seconds,
+            '-' if result['peakBytes'] is None else '%.1fMB' % (result['peakBytes'] / 1e6),
+            '-' if result['verticesPerSecond'] is None else '%.0f v/s' % result['verticesPerSecond']))
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'results': results}, f, indent=2, sort_keys=True)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = dict((r['name'], r) for r in json.load(f)['results'])
+
+        regressions = compareResults(results, baseline, args.threshold, args.min_seconds)
+        for name, old, new in regressions:
+            sys.stdout.write("REGRESSION %s: %.4fs -> %.4fs (%+.0f%%)\n" %
+                             (name, old, new, 100.0 * (new - old) / old))
+        if regressions:
+            sys.exit(1)
+
+
+# Return (name, baseline seconds, seconds) for every result more than
+# threshold (a fraction) and at least minSeconds slower than its baseline
+def compareResults(results, baseline, threshold, minSeconds=0.0):
+    regressions = []
+    for result in results:
+        old = baseline.get(result['name'])
+        if old is None:
+            continue
+        if result['seconds'] > old['seconds'] * (1.0 + threshold) and \
+                result['seconds'] - old['seconds'] >= minSeconds:
+            regressions.append((result['name'], old['seconds'], result['seconds']))
+    return regressions
+
+
+def benchParallel(args):
+    verts, quads = cubeArrays(args.level)
+    sys.stdout.write("cage: %d vertices, %d quads\n" % (len(verts), len(quads)))
+
+    def serialLevels(arg):
+        levelVerts, levelQuads = verts, quads
+        for level in range(args.levels):
+            refinement = Refinement(levelQuads, len(levelVerts))
+            levelVerts = refinement.apply(levelVerts)
+            levelQuads = refinement.refinedQuads()
+
+    serial = bestTime(serialLevels, args.repeat)
+    sys.stdout.write("%-8s %10s %8s\n" % ("workers", "seconds", "speedup"))
+    sys.stdout.write("%-8s %10.4f %8.2f\n" % ("serial", serial, 1.0))
+
+    for workers in range(1, args.workers + 1):
+        elapsed = bestTime(lambda arg: subdivideParallel(quads, verts, workers, levels=args.levels),
+                           args.repeat)
+        sys.stdout.write("%-8d %10.4f %8.2f\n" % (workers, elapsed, serial / elapsed))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Subdivision benchmarks")
+    commands = parser.add_subparsers(dest="command")
+
+    suite = commands.add_parser("suite", help="time the mesh operations across levels and cage sizes")
+    suite.add_argument("--max-level", type=int, default=7, help="deepest subdivision level")
+    suite.add_argument("--max-quads", type=int, default=2000000,
+                       help="skip levels with more quads than this")
+    suite.add_argument("--python-max-quads", type=int, default=100000,
+                       help="skip the python engine for levels with more quads than this")
+    suite.add_argument("--repeat", type=int, default=5, help="runs per timing, best is kept")
+    suite.add_argument("--output", help="write the results to this JSON file")
+    suite.add_argument("--baseline", help="compare against the results in this JSON file")
+    suite.add_argument("--threshold", type=float, default=0.2,
+                       help="slowdown over the baseline (a fraction) that counts as a regression")
+    suite.add_argument("--min-seconds", type=float, default=0.001,
+                       help="smallest slowdown in seconds that counts as a regression")
+    suite.set_defaults(run=benchSuite)
+
+    parallel = commands.add_parser("parallel", help="parallel engine scaling over worker counts")
+    parallel.add_argument("--level", type=int, default=6, help="subdivision level of the cage")
+    parallel.add_argument("--levels", type=int, default=1, help="levels refined in every timed run")
+    parallel.add_argument("--workers", type=int, default=multiprocessing.cpu_count(),
+                          help="largest worker count to time")
+    parallel.add_argument("--repeat", type=int, default=3, help="runs per timing, best is kept")
+    parallel.set_defaults(run=benchParallel)
+
+    args = parser.parse_args()
+    args.run(args)
@@ -0,0 +1,194 @@
+##############################################################################
+# This software is licensed under a modified MIT license. The MIT license itself
+# is unchanged, we have only added an optional beerware clause (based off of
+# Poul-Henning Kamp's Beerware license). That is to say, you have the option
+# of completely disregarding the beerware clause and using this software under
+# the vanilla MIT license if you so wish.
+#
+# Copyright (c) 2013 Chris Gibson
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
+# Optional beerware clause:
+# If we happen to meet in person someday and you think this software is worth
+# it, you are welcome to buy us a round of beers. This clause is entirely
+# optional, and need not be fulfilled for you to fully comply with the terms
+# of this license.
+##############################################################################
+
+import hashlib
+import os
+import struct
+from collections import OrderedDict
+
+import numpy as np
+
+import stream
+from fileutil import atomicWrite
+from refine import subdivideBatch
+
+
+# A content-addressed cache of subdivision results.
+#
+# Results are keyed by a hash of the vertex positions, the quad topology, the
+# level count and the weighting technique, so the same cage asked for twice is
+# only refined once. The memory tier keeps the most recently used results up to
+# maxBytes and evicts the least recently used beyond that. If a directory is
+# given, results are also written there as .npy files and memory-mapped back
+# on a memory miss, which lets them outlive the process. Memory-mapped results
+# count towards maxBytes by their mapped size like any other, and as each one
+# holds a file descriptor open per array, at most maxMapped of them are kept;
+# beyond that the least recently used one is evicted. An evicted map is closed
+# once no caller holds its arrays any more.
+#
+# Cached arrays are shared between callers and read-only; copy them to edit.
+class SubdivisionCache(object):
+
+    def __init__(self, maxBytes=256 * 1024 * 1024, directory=None, maxMapped=64):
+        self.maxBytes = maxBytes
+        self.maxMapped = maxMapped
+        self.directory = directory
+        if directory is not None and not os.path.isdir(directory):
+            os.makedirs(directory)
+
+        self._entries = OrderedDict()
+        self.bytes = 0
+        self.mapped = 0
+
+        # Counters, for sizing the cache
+        self.hits = 0
+        self.diskHits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    # Return the cache key of subdividing the given arrays
+    @staticmethod
+    def key(verts, quads, levels, technique=2):
+        verts = np.ascontiguousarray(verts, dtype=np.float64).reshape(-1, 3)
+        quads = np.ascontiguousarray(quads, dtype=np.int64).reshape(-1, 4)
+
+        digest = hashlib.sha1()
+        digest.update(struct.pack('<QQqq', len(verts), len(quads), levels, technique))
+        digest.update(verts.tobytes())
+        digest.update(quads.tobytes())
+        return digest.hexdigest()
+
+    # Return the (verts, quads) arrays of subdividing the given arrays the given
+    # number of levels, from the cache if possible
+    def subdivide(self, verts, quads, levels=1, technique=2):
+        key = self.key(verts, quads, levels, technique)
+
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.hits += 1
+            self._entries[key] = entry
+            return entry
+
+        entry = self._loadFromDisk(key)
+        if entry is not None:
+            self.diskHits += 1
+        else:
+            self.misses += 1
+            refined, refinedQuads = subdivideBatch(quads, np.asarray(verts)[None], levels, technique)
+            entry = (refined[0], refinedQuads)
+            self._saveToDisk(key, entry)
+
+        for array in entry:
+            array.flags.writeable = False
+
+        self._store(key, entry)
+        return entry
+
+    # Subdivide a SubdMesh in place the given number of levels
+    def subdivideMesh(self, mesh, levels=1, technique=2):
+        mesh._setArrays(*self.subdivide(mesh.vertexArray(), mesh.quadArray(), levels, technique))
+
+    # Return the cache counters as a dict
+    def stats(self):
+        return {
+            'hits': self.hits,
+            'diskHits': self.diskHits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'entries': len(self._entries),
+            'bytes': self.bytes,
+            'mapped': self.mapped,
+        }
+
+    # Drop everything held in memory. The disk tier is left alone
+    def clear(self):
+        self._entries.clear()
+        self.bytes = 0
+        self.mapped = 0
+
+    # Add an entry to the memory tier, evicting the oldest entries to make room
+    # and the oldest memory map if there are too many
+    def _store(self, key, entry):
+        size = _entryBytes(entry)
+        if size > self.maxBytes:
+            return
+
+        while self.bytes + size > self.maxBytes:
+            self._evict(next(iter(self._entries)))
+
+        if _isMapped(entry):
+            while self._entries and self.mapped >= self.maxMapped:
+                self._evict(next(oldKey for oldKey, oldEntry in self._entries.items() if _isMapped(oldEntry)))
+            self.mapped += 1
+
+        self._entries[key] = entry
+        self.bytes += size
+
+    # Drop an entry from the memory tier. For a memory map this releases its
+    # file descriptors, unless a caller still holds its arrays
+    def _evict(self, key):
+        entry = self._entries.pop(key)
+        self.bytes -= _entryBytes(entry)
+        if _isMapped(entry):
+            self.mapped -= 1
+        self.evictions += 1
+
+    def _loadFromDisk(self, key):
+        if self.directory is None:
+            return None
+
+        prefix = os.path.join(self.directory, key)
+        if not all(os.path.exists(path) for path in stream.meshPaths(prefix)):
+            return None
+        return stream.loadArrays(prefix)
+
+    # Write an entry's files atomically, so that _loadFromDisk never maps a
+    # partial file
+    def _saveToDisk(self, key, entry):
+        if self.directory is None:
+            return
+
+        for path, array in zip(stream.meshPaths(os.path.join(self.directory, key)), entry):
+            with atomicWrite(path) as f:
+                np.save(f, np.asarray(array))
+
+
+# Return the bytes of an entry's arrays, mapped or not
+def _entryBytes(entry):
+    return sum(array.nbytes for array in entry)
+
+
+# True if an entry was memory-mapped from the disk tier
+def _isMapped(entry):
+    return any(isinstance(array, np.memmap) for array in entry)
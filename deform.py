@@ -0,0 +1,151 @@
+##############################################################################
+# This software is licensed under a modified MIT license. The MIT license itself
+# is unchanged, we have only added an optional beerware clause (based off of
+# Poul-Henning Kamp's Beerware license). That is to say, you have the option
+# of completely disregarding the beerware clause and using this software under
+# the vanilla MIT license if you so wish.
+#
+# Copyright (c) 2013 Chris Gibson
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
+# Optional beerware clause:
+# If we happen to meet in person someday and you think this software is worth
+# it, you are welcome to buy us a round of beers. This clause is entirely
+# optional, and need not be fulfilled for you to fully comply with the terms
+# of this license.
+##############################################################################
+
+import math
+
+import numpy as np
+
+
+# Bulk deformers for mesh vertices.
+#
+# A deformer changes an (N, 3) float vertex array in place with whole-array
+# numpy operations, so the only scratch space is a few length N arrays per
+# pass. Deformers chain with then(), and a pipeline runs its stages one after
+# another on the same array:
+#
+#     Spherize(2.0).then(Twist(0.5)).then(Noise(0.05)).apply(verts)
+
+
+# Base class of all deformers. On its own it is the identity, which leaves
+# the vertices as they are
+class Deformer(object):
+
+    # Deform the (N, 3) vertex array in place. Subclasses override this
+    def apply(self, verts):
+        pass
+
+    # Return a pipeline running this deformer and then the given one
+    def then(self, deformer):
+        return Pipeline(self, deformer)
+
+
+# Runs a list of deformers in order
+class Pipeline(Deformer):
+
+    def __init__(self, *deformers):
+        self.deformers = list(deformers)
+
+    def apply(self, verts):
+        for deformer in self.deformers:
+            deformer.apply(verts)
+
+    def then(self, deformer):
+        return Pipeline(*(self.deformers + [deformer]))
+
+
+# Snap all vertices to a sphere with the specified radius. Vertices at the
+# origin stay there
+class Spherize(Deformer):
+
+    def __init__(self, radius=1.0):
+        self.radius = radius
+
+    def apply(self, verts):
+        scale = np.sqrt(np.einsum('ij,ij->i', verts, verts))
+        np.divide(self.radius, scale, out=scale, where=scale > 0)
+        verts *= scale[:, None]
+
+
+# Scale vertices about the origin, by one factor or one per axis
+class Scale(Deformer):
+
+    def __init__(self, factors):
+        self.factors = factors
+
+    def apply(self, verts):
+        verts *= np.asarray(self.factors, dtype=verts.dtype)
+
+
+# Twist vertices about an axis (0, 1 or 2 for x, y or z), rotating each one by
+# rate radians per unit of its distance along the axis
+class Twist(Deformer):
+
+    def __init__(self, rate, axis=1):
+        self.rate = rate
+        self.axis = axis
+
+    def apply(self, verts):
+        a = verts[:, (self.axis + 1) % 3]
+        b = verts[:, (self.axis + 2) % 3]
+
+        angle = verts[:, self.axis] * self.rate
+        cos = np.cos(angle)
+        sin = np.sin(angle, out=angle)
+
+        # Rotate (a, b) by the angle, keeping the old a for the b update
+        oldA = a.copy()
+        a *= cos
+        a -= sin * b
+        b *= cos
+        b += sin * oldA
+
+
+# Push vertices away from the origin by a smooth noise field. The field is a
+# sum of plane waves with random directions and phases, so it is the same for
+# the same seed and continuous across the surface
+class Noise(Deformer):
+
+    def __init__(self, amplitude=0.05, frequency=4.0, waves=8, seed=0):
+        self.amplitude = amplitude
+        self.frequency = frequency
+
+        rng = np.random.RandomState(seed)
+        directions = rng.normal(size=(waves, 3))
+        self.directions = directions / np.sqrt((directions ** 2).sum(axis=1))[:, None]
+        self.phases = rng.uniform(0.0, 2.0 * math.pi, waves)
+
+    def apply(self, verts):
+        field = np.zeros(len(verts))
+        for direction, phase in zip(self.directions, self.phases):
+            wave = verts.dot(direction)
+            wave *= self.frequency
+            wave += phase
+            field += np.sin(wave, out=wave)
+        field *= self.amplitude / math.sqrt(len(self.phases))
+
+        # Move every vertex along its direction from the origin
+        length = np.sqrt(np.einsum('ij,ij->i', verts, verts))
+        np.divide(field, length, out=field, where=length > 0)
+        field += 1.0
+        verts *= field[:, None]
@@ -0,0 +1,406 @@
+##############################################################################
+# This software is licensed under a modified MIT license. The MIT license itself
+# is unchanged, we have only added an optional beerware clause (based off of
+# Poul-Henning Kamp's Beerware license). That is to say, you have the option
+# of completely disregarding the beerware clause and using this software under
+# the vanilla MIT license if you so wish.
+#
+# Copyright (c) 2013 Chris Gibson
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
+# Optional beerware clause:
+# If we happen to meet in person someday and you think this software is worth
+# it, you are welcome to buy us a round of beers. This clause is entirely
+# optional, and need not be fulfilled for you to fully comply with the terms
+# of this license.
+##############################################################################
+
+import math
+
+import numpy as np
+
+from limit import limitMasks
+from refine import Refinement, WEIGHTS, groupBy
+
+
+# Exact evaluation of catmull-clark limit surfaces at arbitrary (face, u, v).
+#
+# Every quad is parameterized over [0, 1]^2 with its first corner at (0, 0),
+# its second at (1, 0) and its last at (0, 1).
+#
+# Around a quad whose corners all have four quads, the limit surface is a
+# bicubic B-spline patch over the 16 surrounding vertices. Around a quad with
+# one extraordinary corner, the patch is found as in Stam, "Exact Evaluation
+# of Catmull-Clark Subdivision Surfaces at Arbitrary Parameter Values": the
+# 2n + 8 vertices around it are refined k times by a fixed matrix, until the
+# parameter falls in one of the three regular subpatches of that level. The
+# matrices for every depth are worked out once per valence by refining a small
+# local mesh. Meshes where a quad has more than one extraordinary corner are
+# refined once first, which leaves every quad with at most one.
+#
+# Only the original catmull-clark rule (technique 4) has B-spline patches, so
+# that is the surface evaluated here.
+
+TECHNIQUE = 4
+
+# Depth past which a parameter counts as sitting on the extraordinary vertex
+MAX_DEPTH = 40
+
+# The vertices around a quad with an extraordinary corner of valence n are laid
+# out as in Stam: the extraordinary vertex, then its edge neighbour and far
+# corner in each of its n quads, then the 7 vertices past the one ring. In grid
+# coordinates the quad is [0, 1]^2 and the 7 are
+_OUTER = [(2, -1), (2, 0), (2, 1), (2, 2), (1, 2), (0, 2), (-1, 2)]
+
+# One refinement later, the three regular subpatches need 9 more
+_FINE_OUTER = [(3, -1), (3, 0), (3, 1), (3, 2), (3, 3), (2, 3), (1, 3), (0, 3), (-1, 3)]
+
+# The lower left grid corner of the 4x4 points of each regular subpatch, for
+# the subquads at u >= 1/2, at u, v >= 1/2 and at v >= 1/2
+_SUBPATCH = [(0, -1), (0, 0), (-1, 0)]
+
+
+# Return a dict from grid coordinates to the layout index of every vertex near
+# the extraordinary vertex that has grid coordinates
+def _gridLabels(n, fine=False):
+    labels = {(0, 0): 0, (1, 0): 1, (1, 1): 2, (0, 1): 3, (-1, 1): 4, (-1, 0): 5,
+              (0, -1): 2 * n - 1, (1, -1): 2 * n}
+    if n == 4:
+        labels[(-1, -1)] = 6
+
+    for i, xy in enumerate(_OUTER):
+        labels[xy] = 2 * n + 1 + i
+    if fine:
+        for i, xy in enumerate(_FINE_OUTER):
+            labels[xy] = 2 * n + 8 + i
+    return labels
+
+
+# Return the quads of the local mesh over the 2n + 8 layout vertices
+def _localQuads(n):
+    quads = [(0, 1 + 2 * i, 2 + 2 * i, 1 + 2 * ((i + 1) % n)) for i in range(n)]
+
+    grid = _gridLabels(n)
+    for x, y in [(1, -1), (1, 0), (1, 1), (0, 1), (-1, 1)]:
+        quads.append((grid[(x, y)], grid[(x + 1, y)], grid[(x + 1, y + 1)], grid[(x, y + 1)]))
+    return quads
+
+
+# Return the subdivision matrices of valence n: A, which maps the 2n + 8
+# layout vertices to the same layout one level down; the larger matrix that
+# also gives the 9 extra vertices; and the 16 rows of that matrix that make up
+# each regular subpatch
+def _subdivisionMatrices(n):
+    quads = _localQuads(n)
+    size = 2 * n + 8
+    eye = np.eye(size)
+
+    def facePoint(quad):
+        return eye[list(quad)].mean(axis=0)
+
+    def edgePoint(a, b):
+        around = [q for q in quads if a in q and b in q and
+                  (q.index(a) - q.index(b)) % 4 in (1, 3)]
+        return (eye[a] + eye[b] + facePoint(around[0]) + facePoint(around[1])) / 4.0
+
+    def vertexPoint(v):
+        around = [q for q in quads if v in q]
+        neighbours = set()
+        for q in around:
+            neighbours.add(q[(q.index(v) + 1) % 4])
+            neighbours.add(q[(q.index(v) + 3) % 4])
+
+        w1, w2, w3 = WEIGHTS[TECHNIQUE](float(len(around)))
+        return (w1 * eye[v] +
+                w2 * np.mean([facePoint(q) for q in around], axis=0) +
+                w3 * np.mean([edgePoint(v, w) for w in neighbours], axis=0))
+
+    coarse = _gridLabels(n)
+    fine = _gridLabels(n, fine=True)
+    rows = np.zeros((size + 9, size))
+
+    rows[0] = vertexPoint(0)
+    for i in range(n):
+        rows[1 + 2 * i] = edgePoint(0, 1 + 2 * i)
+        rows[2 + 2 * i] = facePoint(quads[i])
+
+    # Every refined grid vertex past the one ring is a vertex, edge or face
+    # point of the coarse grid, depending on which coordinates are odd
+    for (x, y), label in fine.items():
+        if label <= 2 * n:
+            continue
+
+        if x % 2 == 0 and y % 2 == 0:
+            rows[label] = vertexPoint(coarse[(x // 2, y // 2)])
+        elif x % 2 == 0:
+            rows[label] = edgePoint(coarse[(x // 2, (y - 1) // 2)], coarse[(x // 2, (y + 1) // 2)])
+        elif y % 2 == 0:
+            rows[label] = edgePoint(coarse[((x - 1) // 2, y // 2)], coarse[((x + 1) // 2, y // 2)])
+        else:
+            corners = set(coarse[(x // 2 + dx, y // 2 + dy)] for dx in (0, 1) for dy in (0, 1))
+            rows[label] = facePoint([q for q in quads if set(q) == corners][0])
+
+    picks = [[fine[(x + i, y + j)] for j in range(4) for i in range(4)] for x, y in _SUBPATCH]
+    return rows[:size], rows, picks
+
+
+# Return the (MAX_DEPTH, 3, 16, 2n + 8) matrices giving the control points of
+# each regular subpatch at each depth from the layout vertices
+def _depthMatrices(n):
+    A, Abar, picks = _subdivisionMatrices(n)
+
+    out = np.empty((MAX_DEPTH, 3, 16, len(A)))
+    power = np.eye(len(A))
+    for depth in range(MAX_DEPTH):
+        for sub, pick in enumerate(picks):
+            out[depth, sub] = Abar[pick].dot(power)
+        power = A.dot(power)
+    return out
+
+
+# Return the uniform cubic B-spline basis functions and their derivatives at t,
+# as two (S, 4) arrays
+def _bspline(t):
+    s = 1.0 - t
+    basis = np.column_stack([s ** 3,
+                             3.0 * t ** 3 - 6.0 * t ** 2 + 4.0,
+                             -3.0 * t ** 3 + 3.0 * t ** 2 + 3.0 * t + 1.0,
+                             t ** 3]) / 6.0
+    deriv = np.column_stack([-s ** 2,
+                             3.0 * t ** 2 - 4.0 * t,
+                             -3.0 * t ** 2 + 2.0 * t + 1.0,
+                             t ** 2]) / 2.0
+    return basis, deriv
+
+
+# Return the (S, 16) weights of a 4x4 patch's control points for the position
+# and the u and v derivatives at (u, v)
+def _patchWeights(u, v):
+    bu, du = _bspline(u)
+    bv, dv = _bspline(v)
+    return ((bv[:, :, None] * bu[:, None, :]).reshape(-1, 16),
+            (bv[:, :, None] * du[:, None, :]).reshape(-1, 16),
+            (dv[:, :, None] * bu[:, None, :]).reshape(-1, 16))
+
+
+# Turn quad parameters so that the given corner sits at (0, 0)
+def _turn(u, v, corners):
+    corners = corners % 4
+    return (np.choose(corners, [u, v, 1.0 - u, 1.0 - v]),
+            np.choose(corners, [v, 1.0 - u, 1.0 - v, u]))
+
+
+# Turn derivatives taken in turned parameters back to the quad's own
+def _unturn(du, dv, corners):
+    corners = (corners % 4)[:, None]
+    return (np.choose(corners, [du, -dv, -du, dv]),
+            np.choose(corners, [dv, du, -dv, -du]))
+
+
+# Evaluates the limit surface of a closed quad mesh. The mesh is copied, so
+# later changes to it are not seen
+class LimitEvaluator(object):
+
+    def __init__(self, verts, quads):
+        self.verts = np.array(verts, dtype=np.float64).reshape(-1, 3)
+        self.quads = np.array(quads, dtype=np.int64).reshape(-1, 4)
+        self.faceCount = len(self.quads)
+
+        # Isolate extraordinary vertices so no quad has more than one
+        valence = np.bincount(self.quads.ravel(), minlength=len(self.verts))
+        self.refined = bool(np.any((valence[self.quads] != 4).sum(axis=1) > 1))
+        if self.refined:
+            refinement = Refinement(self.quads, len(self.verts))
+            self.verts = refinement.apply(self.verts, TECHNIQUE)
+            self.quads = refinement.refinedQuads()
+            valence = np.bincount(self.quads.ravel(), minlength=len(self.verts))
+
+        # The twin of every half edge, the one running the other way
+        heStart = self.quads.ravel()
+        heEnd = np.roll(self.quads, -1, axis=1).ravel()
+        keys = heStart * len(self.verts) + heEnd
+        order = np.argsort(keys)
+        pos = np.minimum(np.searchsorted(keys[order], heEnd * len(self.verts) + heStart), len(keys) - 1)
+        if np.any(keys[order][pos] != heEnd * len(self.verts) + heStart) or \
+           np.any(np.diff(keys[order]) == 0):
+            raise ValueError("mesh is not closed: every edge must border exactly two quads")
+        self.twins = order[pos]
+
+        # The extraordinary corner of every quad (0 if there is none) and its valence
+        irregular = valence[self.quads] != 4
+        self.faceCorner = np.argmax(irregular, axis=1)
+        self.faceValence = valence[self.quads[np.arange(len(self.quads)), self.faceCorner]]
+
+        self._matrices = {}
+
+    # Return the limit positions and the u and v derivatives, each (S, 3), at
+    # arrays of face indices and (u, v) parameters
+    def evaluate(self, faces, u, v):
+        faces, u, v = np.broadcast_arrays(np.asarray(faces, dtype=np.int64),
+                                          np.asarray(u, dtype=np.float64),
+                                          np.asarray(v, dtype=np.float64))
+        faces, u, v = faces.ravel(), u.ravel(), v.ravel()
+
+        if np.any((faces < 0) | (faces >= self.faceCount)):
+            raise ValueError("face index out of range [0, %s)" % self.faceCount)
+        if np.any((u < 0) | (u > 1) | (v < 0) | (v > 1)):
+            raise ValueError("u and v must lie in [0, 1]")
+
+        if not self.refined:
+            return self._evaluate(faces, u, v)
+
+        # Find the subquad around the nearest corner. Its corners are (face
+        # point, previous edge point, old corner, next edge point), which puts
+        # the old corner at (1, 1)
+        corners = np.where(u < 0.5, np.where(v < 0.5, 0, 3), np.where(v < 0.5, 1, 2))
+        tu, tv = _turn(u, v, corners)
+
+        pos, du, dv = self._evaluate(4 * faces + corners, 1.0 - 2.0 * tu, 1.0 - 2.0 * tv)
+        du, dv = _unturn(-2.0 * du, -2.0 * dv, corners)
+        return pos, du, dv
+
+    # Evaluate on the quads the evaluator holds
+    def _evaluate(self, faces, u, v):
+        corners = self.faceCorner[faces]
+        tu, tv = _turn(u, v, corners)
+
+        pos = np.empty((len(faces), 3))
+        du = np.empty((len(faces), 3))
+        dv = np.empty((len(faces), 3))
+
+        valence = self.faceValence[faces]
+        for n in np.unique(valence):
+            rows = np.nonzero(valence == n)[0]
+            points = self.verts[self._layout(faces[rows], corners[rows], n)]
+
+            if n == 4:
+                evaluated = self._evaluateRegular(points, tu[rows], tv[rows])
+            else:
+                evaluated = self._evaluateIrregular(points, tu[rows], tv[rows], n)
+            pos[rows], du[rows], dv[rows] = evaluated
+
+        du, dv = _unturn(du, dv, corners)
+        return pos, du, dv
+
+    # Return the (S, 2n + 8) indices of the layout vertices around the given
+    # quads, turned so the given corner is the extraordinary one
+    def _layout(self, faces, corners, n):
+        q = self.quads.ravel()
+        twins = self.twins
+
+        def nxt(h):
+            return h - h % 4 + (h + 1) % 4
+
+        def prv(h):
+            return h - h % 4 + (h + 3) % 4
+
+        out = np.empty((len(faces), 2 * n + 8), dtype=np.int64)
+        first = 4 * faces + corners
+        out[:, 0] = q[first]
+
+        # Walk the quads around the extraordinary vertex
+        h = first
+        for i in range(n):
+            out[:, 1 + 2 * i] = q[nxt(h)]
+            out[:, 2 + 2 * i] = q[nxt(nxt(h))]
+            h = twins[prv(h)]
+
+        # Step into the neighbouring quads across the far edges
+        right = twins[nxt(first)]
+        top = twins[nxt(nxt(first))]
+        topRight = twins[prv(right)]
+        bottomRight = twins[nxt(right)]
+        topLeft = twins[prv(top)]
+
+        out[:, 2 * n + 1:] = np.column_stack([q[prv(bottomRight)], q[nxt(nxt(right))],
+                                              q[prv(right)], q[nxt(nxt(topRight))],
+                                              q[prv(topRight)], q[prv(top)],
+                                              q[nxt(nxt(topLeft))]])
+        return out
+
+    # Evaluate bicubic patches over the (S, 16) layout points of regular quads
+    def _evaluateRegular(self, points, u, v):
+        grid = _gridLabels(4)
+        pick = [grid[(i - 1, j - 1)] for j in range(4) for i in range(4)]
+        control = points[:, pick]
+
+        return [np.einsum('si,sic->sc', w, control) for w in _patchWeights(u, v)]
+
+    # Evaluate quads with an extraordinary vertex of valence n at (0, 0)
+    def _evaluateIrregular(self, points, u, v, n):
+        if n not in self._matrices:
+            self._matrices[n] = _depthMatrices(n)
+        matrices = self._matrices[n]
+
+        # Find the depth at which (u, v) leaves the extraordinary vertex's
+        # subquad, and the regular subpatch it lands in there
+        largest = np.maximum(u, v)
+        depth = np.full(len(u), MAX_DEPTH, dtype=np.int64)
+        away = largest > 0
+        depth[away] = np.minimum(np.floor(-np.log2(largest[away])).astype(np.int64) + 1, MAX_DEPTH)
+
+        scale = 2.0 ** (depth - 1)
+        su, sv = u * scale, v * scale
+        sub = np.where(su >= 0.5, np.where(sv >= 0.5, 1, 0), 2)
+        su = np.clip(np.where(sub == 2, 2.0 * su, 2.0 * su - 1.0), 0.0, 1.0)
+        sv = np.clip(np.where(sub == 0, 2.0 * sv, 2.0 * sv - 1.0), 0.0, 1.0)
+
+        out = [np.empty((len(u), 3)) for i in range(3)]
+        weights = _patchWeights(su, sv)
+
+        order, start = groupBy((depth - 1) * 3 + sub, 3 * MAX_DEPTH)
+        for k in np.nonzero(np.diff(start))[0]:
+            rows = order[start[k]:start[k + 1]]
+            control = np.matmul(matrices[k // 3, k % 3], points[rows])
+
+            for i, w in enumerate(weights):
+                out[i][rows] = np.einsum('si,sic->sc', w[rows], control)
+
+        # Derivatives scale with the size of the subpatch
+        out[1] *= (2.0 * scale)[:, None]
+        out[2] *= (2.0 * scale)[:, None]
+
+        # Right on the extraordinary vertex, use its limit position. The
+        # parametric derivatives are not defined there, so return the limit
+        # tangents toward the quad's first and last edges instead, from the
+        # tangent masks of Halstead et al. These span the tangent plane
+        on = ~away
+        if np.any(on):
+            ring = points[on]
+            edges = ring[:, 1:2 * n + 1:2]
+            corners = ring[:, 2:2 * n + 1:2]
+
+            a, b, c = limitMasks(n, TECHNIQUE)
+            out[0][on] = a * ring[:, 0] + b * edges.sum(axis=1) + c * corners.sum(axis=1)
+
+            angle = 2.0 * math.pi * np.arange(n) / n
+            edgeWeight = (1.0 + math.cos(2.0 * math.pi / n) +
+                          math.cos(math.pi / n) * math.sqrt(2.0 * (9.0 + math.cos(2.0 * math.pi / n))))
+            tangents = []
+            for wave in (np.cos, np.sin):
+                edgeMask = edgeWeight * wave(angle)
+                cornerMask = wave(angle) + wave(np.roll(angle, -1))
+                tangents.append(np.einsum('i,sic->sc', edgeMask, edges) +
+                                np.einsum('i,sic->sc', cornerMask, corners))
+
+            out[1][on] = tangents[0]
+            out[2][on] = math.cos(angle[1]) * tangents[0] + math.sin(angle[1]) * tangents[1]
+
+        return out
@@ -0,0 +1,65 @@
+##############################################################################
+# This software is licensed under a modified MIT license. The MIT license itself
+# is unchanged, we have only added an optional beerware clause (based off of
+# Poul-Henning Kamp's Beerware license). That is to say, you have the option
+# of completely disregarding the beerware clause and using this software under
+# the vanilla MIT license if you so wish.
+#
+# Copyright (c) 2013 Chris Gibson
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
+# Optional beerware clause:
+# If we happen to meet in person someday and you think this software is worth
+# it, you are welcome to buy us a round of beers. This clause is entirely
+# optional, and need not be fulfilled for you to fully comply with the terms
+# of this license.
+##############################################################################
+
+import contextlib
+import os
+
+
+# Move a file over another. Where rename does not replace an existing file
+# (Windows), the old one is removed and the rename tried again
+def replaceFile(source, target):
+    try:
+        os.rename(source, target)
+    except OSError:
+        if not os.path.exists(target):
+            raise
+        os.remove(target)
+        os.rename(source, target)
+
+
+# Open a file for writing in binary under a temporary name next to filename,
+# and move it into place once the block finishes, so that a crash or another
+# process never sees a partial file. The temporary file is removed if anything
+# fails
+@contextlib.contextmanager
+def atomicWrite(filename):
+    temporary = "%s.%d.tmp" % (filename, os.getpid())
+    try:
+        with open(temporary, 'wb') as f:
+            yield f
+        replaceFile(temporary, filename)
+    except BaseException:
+        if os.path.exists(temporary):
+            os.remove(temporary)
+        raise
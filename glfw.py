@@ -334,8 +334,11 @@ glfwSetMouseWheel            = __glfwdll__.glfwSetMouseWheel
 
 # Time
 glfwGetTime                  = __glfwdll__.glfwGetTime
+glfwGetTime.restype          = ctypes.c_double
 glfwSetTime                  = __glfwdll__.glfwSetTime
+glfwSetTime.argtypes         = [ctypes.c_double]
 glfwSleep                    = __glfwdll__.glfwSleep
+glfwSleep.argtypes           = [ctypes.c_double]
 
 # Extension support
 # glfwExtensionSupported( const char *extension );
@@ -0,0 +1,437 @@
+##############################################################################
+# This software is licensed under a modified MIT license. The MIT license itself
+# is unchanged, we have only added an optional beerware clause (based off of
+# Poul-Henning Kamp's Beerware license). That is to say, you have the option
+# of completely disregarding the beerware clause and using this software under
+# the vanilla MIT license if you so wish.
+#
+# Copyright (c) 2013 Chris Gibson
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
+# Optional beerware clause:
+# If we happen to meet in person someday and you think this software is worth
+# it, you are welcome to buy us a round of beers. This clause is entirely
+# optional, and need not be fulfilled for you to fully comply with the terms
+# of this license.
+##############################################################################
+
+import ctypes
+import math
+import threading
+
+import numpy as np
+from OpenGL.GL import *
+
+from mesh import SubdMesh
+
+
+# Keeping refined meshes on the GPU without stalling the render loop.
+#
+# A SubdivisionWorker refines the cage on a background thread. The render loop
+# hands the finished buffers to a DoubleBufferedMesh, which copies them into
+# its back buffers with glBufferSubData a slice per frame. It draws from the
+# front buffers until the copy is complete, then swaps. Buffers are only
+# reallocated when a mesh outgrows them.
+#
+# A LodPyramid instead holds every level at once and picks one per frame, and
+# an InstancedMesh draws many copies of one level in a single call.
+
+
+# Return the triangle vertex and index buffers (see SubdMesh.toTriangleArrays)
+# of the cage subdivided the given number of times and moved onto the limit
+# surface
+def levelBuffers(cage, level, technique=2):
+    msh = SubdMesh.fromArrays(cage.vertexArray(), cage.quadArray())
+    for i in range(level):
+        msh.subdivide(engine='numpy', technique=technique)
+    if level > 0:
+        msh.projectToLimit(technique)
+    return msh.toTriangleArrays()
+
+
+# Yield the triangle buffers of every level from 0 to levels, subdividing the
+# cage once per level
+def pyramidBuffers(cage, levels, technique=2):
+    msh = SubdMesh.fromArrays(cage.vertexArray(), cage.quadArray())
+    for level in range(levels + 1):
+        if level > 0:
+            msh.subdivide(engine='numpy', technique=technique)
+            limit = SubdMesh.fromArrays(msh.vertexArray(), msh.quadArray())
+            limit.projectToLimit(technique)
+            yield limit.toTriangleArrays()
+        else:
+            yield msh.toTriangleArrays()
+
+
+# Return the highest level whose quad count stays within maxQuads, for a cage
+# of quadCount quads. Every level has four times the quads of the one before;
+# level 0 is always kept
+def budgetLevel(quadCount, maxQuads):
+    level = 0
+    while quadCount * 4 ** (level + 1) <= maxQuads:
+        level += 1
+    return level
+
+
+# Return the vertex and index buffers of every level a LodPyramid holds for a
+# budget of maxQuads quads in the top level, as a list of each. Made to be run
+# by a SubdivisionWorker, with the budget in place of the level
+def lodBuffers(cage, maxQuads, technique=2):
+    levels = budgetLevel(len(cage.quadArray()), maxQuads)
+    buffers = list(pyramidBuffers(cage, levels, technique))
+    return [verts for verts, indices in buffers], [indices for verts, indices in buffers]
+
+
+# Builds the buffers of a requested level on a background thread. Only the
+# newest request is worked on; requests made while a level is being built
+# replace each other
+class SubdivisionWorker(object):
+
+    def __init__(self, cage, build=levelBuffers):
+        self._cage = cage
+        self._build = build
+
+        self._lock = threading.Lock()
+        self._wake = threading.Condition(self._lock)
+        self._pending = None
+        self._result = None
+        self._building = False
+        self._stopped = False
+
+        self._thread = threading.Thread(target=self._run)
+        self._thread.daemon = True
+        self._thread.start()
+
+    # Ask for the buffers of a level. Returns at once
+    def request(self, level):
+        with self._wake:
+            self._pending = level
+            self._wake.notify()
+
+    # Return the newest finished (level, vertices, indices), or None if
+    # nothing has finished since the last call. If the build failed, its
+    # error is raised here instead, on the caller's thread
+    def takeResult(self):
+        with self._lock:
+            result = self._result
+            self._result = None
+        if isinstance(result, BaseException):
+            raise result
+        return result
+
+    # True while a requested level is waiting, being built or not yet taken
+    @property
+    def busy(self):
+        with self._lock:
+            return self._pending is not None or self._building or self._result is not None
+
+    # Stop the thread once the level being built, if any, is done
+    def stop(self):
+        with self._wake:
+            self._stopped = True
+            self._wake.notify()
+        self._thread.join()
+
+    def _run(self):
+        while True:
+            with self._wake:
+                while self._pending is None and not self._stopped:
+                    self._wake.wait()
+                if self._stopped:
+                    return
+                level = self._pending
+                self._pending = None
+                self._building = True
+
+            # Clear the building flag even if the build fails, and hand the
+            # error to takeResult
+            result = None
+            try:
+                verts, indices = self._build(self._cage, level)
+                result = (level, verts, indices)
+            except Exception as error:
+                result = error
+            finally:
+                with self._lock:
+                    self._result = result
+                    self._building = False
+
+
+# One VAO with its own vertex and index buffer
+class _BufferSlot(object):
+
+    def __init__(self, attributes, stride):
+        self.vao = glGenVertexArrays(1)
+        self.vbo, self.ibo = glGenBuffers(2)
+        self.vertexCapacity = 0
+        self.indexCapacity = 0
+        self.count = 0
+
+        glBindVertexArray(self.vao)
+        glBindBuffer(GL_ARRAY_BUFFER, self.vbo)
+        for location, size, offset in attributes:
+            if location < 0:
+                continue
+            glEnableVertexAttribArray(location)
+            glVertexAttribPointer(location, size, GL_FLOAT, GL_FALSE, stride, ctypes.c_void_p(offset))
+        glBindBuffer(GL_ELEMENT_ARRAY_BUFFER, self.ibo)
+        glBindVertexArray(0)
+        glBindBuffer(GL_ARRAY_BUFFER, 0)
+
+    # Make room for the given number of bytes, growing by doubling
+    def reserve(self, vertexBytes, indexBytes):
+        glBindVertexArray(self.vao)
+        if vertexBytes > self.vertexCapacity:
+            self.vertexCapacity = max(vertexBytes, 2 * self.vertexCapacity)
+            glBindBuffer(GL_ARRAY_BUFFER, self.vbo)
+            glBufferData(GL_ARRAY_BUFFER, self.vertexCapacity, None, GL_DYNAMIC_DRAW)
+        if indexBytes > self.indexCapacity:
+            self.indexCapacity = max(indexBytes, 2 * self.indexCapacity)
+            glBufferData(GL_ELEMENT_ARRAY_BUFFER, self.indexCapacity, None, GL_DYNAMIC_DRAW)
+        glBindVertexArray(0)
+        glBindBuffer(GL_ARRAY_BUFFER, 0)
+
+    # Copy whole vertex and index arrays in at once
+    def upload(self, verts, indices):
+        verts = np.ascontiguousarray(verts, dtype=np.float32)
+        indices = np.ascontiguousarray(indices, dtype=np.uint32)
+        self.reserve(verts.nbytes, indices.nbytes)
+
+        glBindVertexArray(self.vao)
+        glBindBuffer(GL_ARRAY_BUFFER, self.vbo)
+        glBufferSubData(GL_ARRAY_BUFFER, 0, verts.nbytes, verts)
+        glBufferSubData(GL_ELEMENT_ARRAY_BUFFER, 0, indices.nbytes, indices)
+        glBindVertexArray(0)
+        glBindBuffer(GL_ARRAY_BUFFER, 0)
+        self.count = len(indices)
+
+
+# Two sets of GPU buffers for one mesh: the front set is drawn while the back
+# set is filled. attributes lists (location, float count, byte offset) of every
+# vertex attribute in the interleaved vertex buffer, stride bytes apart.
+# At most chunkBytes are copied per update() call
+class DoubleBufferedMesh(object):
+
+    def __init__(self, attributes, stride, chunkBytes=1 << 20):
+        self.chunkBytes = chunkBytes
+        self._slots = [_BufferSlot(attributes, stride) for i in range(2)]
+        self._front = None
+        self._back = 0
+        self._upload = None
+
+        # The level drawn, and the one being uploaded
+        self.level = None
+        self.pendingLevel = None
+
+    # Start copying new vertex and index arrays into the back buffers,
+    # dropping any copy still in progress
+    def stage(self, verts, indices, level=None):
+        verts = np.ascontiguousarray(verts, dtype=np.float32)
+        indices = np.ascontiguousarray(indices, dtype=np.uint32)
+
+        slot = self._slots[self._back]
+        slot.reserve(verts.nbytes, indices.nbytes)
+        self._upload = [(GL_ARRAY_BUFFER, verts.view(np.uint8).ravel(), 0),
+                        (GL_ELEMENT_ARRAY_BUFFER, indices.view(np.uint8).ravel(), 0)]
+        self._uploadCount = len(indices)
+        self.pendingLevel = level
+
+    # Copy the next slice of a staged mesh, and swap it to the front once it
+    # is all there. Returns True on a swap
+    def update(self):
+        if self._upload is None:
+            return False
+
+        slot = self._slots[self._back]
+        budget = self.chunkBytes
+
+        glBindVertexArray(slot.vao)
+        for i, (target, data, done) in enumerate(self._upload):
+            if budget <= 0 or done == len(data):
+                continue
+            size = min(budget, len(data) - done)
+            glBindBuffer(target, slot.vbo if target == GL_ARRAY_BUFFER else slot.ibo)
+            glBufferSubData(target, done, size, data[done:done + size])
+            self._upload[i] = (target, data, done + size)
+            budget -= size
+        glBindVertexArray(0)
+        glBindBuffer(GL_ARRAY_BUFFER, 0)
+
+        if any(done < len(data) for target, data, done in self._upload):
+            return False
+
+        # All in: draw from the new buffers from now on
+        slot.count = self._uploadCount
+        self._front, self._back = self._back, 1 - self._back
+        self._upload = None
+        self.level, self.pendingLevel = self.pendingLevel, None
+        return True
+
+    # True while a staged mesh is still being copied
+    @property
+    def uploading(self):
+        return self._upload is not None
+
+    # Draw the front buffers, if anything has been uploaded yet
+    def draw(self, mode):
+        if self._front is None:
+            return
+
+        slot = self._slots[self._front]
+        glBindVertexArray(slot.vao)
+        glDrawElements(mode, slot.count, GL_UNSIGNED_INT, None)
+        glBindVertexArray(0)
+
+
+# Every level of a cage from 0 up, each uploaded once into its own GPU buffers.
+# The buffers of the levels come from lodBuffers, so they can be built off the
+# render thread, and there are as many levels as the quad budget allows.
+# select() picks the level to draw from how large the mesh appears on
+# screen: the coarsest level whose quad edges are at most targetPixels long.
+# Switching levels only changes which buffers are drawn
+class LodPyramid(object):
+
+    def __init__(self, cage, levelVerts, levelIndices, attributes, stride, targetPixels=12.0):
+        self.targetPixels = targetPixels
+
+        # Every level halves the edges, so the cage edge length is enough to
+        # size all of them
+        verts = np.asarray(cage.vertexArray(), dtype=np.float64)
+        quads = cage.quadArray()
+        self.center = verts.mean(axis=0)
+        self.edgeLength = np.sqrt(((verts[quads] - verts[np.roll(quads, -1, axis=1)]) ** 2).sum(axis=2)).mean()
+
+        self._slots = []
+        for verts, indices in zip(levelVerts, levelIndices):
+            slot = _BufferSlot(attributes, stride)
+            slot.upload(verts, indices)
+            self._slots.append(slot)
+
+        self.level = 0
+
+    # The number of levels held
+    @property
+    def levelCount(self):
+        return len(self._slots)
+
+    # Pick the level for a camera at the given eye position, with a vertical
+    # field of view of fovy degrees over viewportHeight pixels. Returns it
+    def select(self, eye, fovy, viewportHeight):
+        distance = math.sqrt(((np.asarray(eye, dtype=np.float64) - self.center) ** 2).sum())
+        pixelsPerUnit = viewportHeight / (2.0 * math.tan(math.radians(fovy) / 2.0) * max(distance, 1e-6))
+
+        edgePixels = self.edgeLength * pixelsPerUnit
+        level = int(math.ceil(math.log(max(edgePixels / self.targetPixels, 1.0), 2)))
+        self.level = min(level, self.levelCount - 1)
+        return self.level
+
+    # Draw the selected level, or the given one
+    def draw(self, mode, level=None):
+        slot = self._slots[self.level if level is None else level]
+        glBindVertexArray(slot.vao)
+        glDrawElements(mode, slot.count, GL_UNSIGNED_INT, None)
+        glBindVertexArray(0)
+
+
+# One mesh drawn many times with a single glDrawElementsInstanced call. Every
+# instance has a 4x4 model matrix and a color, kept in a per-instance buffer
+# and read by shader.vs through the vs_model and vs_color attributes (the
+# instanced uniform must be set). modelLocation is the location of vs_model;
+# a mat4 attribute takes it and the three locations after it
+class InstancedMesh(object):
+
+    # Bytes per instance: 16 floats of matrix and 4 of color
+    INSTANCE_STRIDE = 20 * 4
+
+    def __init__(self, verts, indices, attributes, stride, modelLocation, colorLocation):
+        self._slot = _BufferSlot(attributes, stride)
+        self.setMesh(verts, indices)
+
+        self.instanceBuffer = glGenBuffers(1)
+        self.instanceCount = 0
+        self._capacity = 0
+
+        glBindVertexArray(self._slot.vao)
+        glBindBuffer(GL_ARRAY_BUFFER, self.instanceBuffer)
+        for column in range(4):
+            glEnableVertexAttribArray(modelLocation + column)
+            glVertexAttribPointer(modelLocation + column, 4, GL_FLOAT, GL_FALSE,
+                                  self.INSTANCE_STRIDE, ctypes.c_void_p(16 * column))
+            glVertexAttribDivisor(modelLocation + column, 1)
+        glEnableVertexAttribArray(colorLocation)
+        glVertexAttribPointer(colorLocation, 4, GL_FLOAT, GL_FALSE,
+                              self.INSTANCE_STRIDE, ctypes.c_void_p(64))
+        glVertexAttribDivisor(colorLocation, 1)
+        glBindVertexArray(0)
+        glBindBuffer(GL_ARRAY_BUFFER, 0)
+
+    # Replace the mesh every instance draws, keeping the instances
+    def setMesh(self, verts, indices):
+        self._slot.upload(verts, indices)
+
+    # Replace the instances with a (K, 4, 4) array of row-major model matrices
+    # and a (K, 4) array of RGBA colors
+    def setInstances(self, transforms, colors):
+        transforms = np.asarray(transforms, dtype=np.float32).reshape(-1, 4, 4)
+        colors = np.asarray(colors, dtype=np.float32).reshape(-1, 4)
+        if len(transforms) != len(colors):
+            raise ValueError("got %s transforms but %s colors" % (len(transforms), len(colors)))
+
+        # GLSL reads a mat4 attribute a column at a time
+        data = np.empty((len(transforms), 20), dtype=np.float32)
+        data[:, :16] = transforms.transpose(0, 2, 1).reshape(-1, 16)
+        data[:, 16:] = colors
+
+        glBindBuffer(GL_ARRAY_BUFFER, self.instanceBuffer)
+        if data.nbytes > self._capacity:
+            self._capacity = max(data.nbytes, 2 * self._capacity)
+            glBufferData(GL_ARRAY_BUFFER, self._capacity, None, GL_DYNAMIC_DRAW)
+        glBufferSubData(GL_ARRAY_BUFFER, 0, data.nbytes, data)
+        glBindBuffer(GL_ARRAY_BUFFER, 0)
+        self.instanceCount = len(data)
+
+    # Draw every instance
+    def draw(self, mode):
+        if self.instanceCount == 0:
+            return
+
+        glBindVertexArray(self._slot.vao)
+        glDrawElementsInstanced(mode, self._slot.count, GL_UNSIGNED_INT, None, self.instanceCount)
+        glBindVertexArray(0)
+
+
+# Return (K, 4, 4) model matrices placing rows x columns copies on a grid in
+# the xz plane, spacing apart and scaled by scale, and (K, 4) colors shading
+# across the grid
+def gridInstances(rows, columns, spacing=1.0, scale=0.3):
+    x, z = np.meshgrid((np.arange(columns) - (columns - 1) / 2.0) * spacing,
+                       (np.arange(rows) - (rows - 1) / 2.0) * spacing)
+    count = rows * columns
+
+    transforms = np.zeros((count, 4, 4))
+    transforms[:, 0, 0] = transforms[:, 1, 1] = transforms[:, 2, 2] = scale
+    transforms[:, 3, 3] = 1.0
+    transforms[:, 0, 3] = x.ravel()
+    transforms[:, 2, 3] = z.ravel()
+
+    colors = np.ones((count, 4))
+    colors[:, 1] = np.linspace(0.0, 1.0, count)
+    colors[:, 2] = np.linspace(1.0, 0.0, count)
+    return transforms, colors
@@ -0,0 +1,187 @@
+##############################################################################
+# This software is licensed under a modified MIT license. The MIT license itself
+# is unchanged, we have only added an optional beerware clause (based off of
+# Poul-Henning Kamp's Beerware license). That is to say, you have the option
+# of completely disregarding the beerware clause and using this software under
+# the vanilla MIT license if you so wish.
+#
+# Copyright (c) 2013 Chris Gibson
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
+# Optional beerware clause:
+# If we happen to meet in person someday and you think this software is worth
+# it, you are welcome to buy us a round of beers. This clause is entirely
+# optional, and need not be fulfilled for you to fully comply with the terms
+# of this license.
+##############################################################################
+
+# Offscreen rendering for the viewer's headless benchmark mode.
+#
+# An OffscreenContext renders into a framebuffer object on an EGL context with
+# no window, which Mesa's software rasterizer provides on machines without a
+# display. A FrameTimer measures every frame on the CPU and with a
+# GL_TIME_ELAPSED query on the GPU, and writeReport saves the per-frame rows
+# as CSV or JSON.
+#
+# PyOpenGL picks its platform on first import, so this module must be
+# imported before anything else imports OpenGL.
+
+import ctypes
+import json
+import os
+import time
+
+os.environ.setdefault('PYOPENGL_PLATFORM', 'egl')
+# Mesa otherwise looks for an X11 or Wayland display
+os.environ.setdefault('EGL_PLATFORM', 'surfaceless')
+
+from OpenGL import EGL
+from OpenGL.GL import *
+
+
+# Columns of the per-frame report, in order
+REPORT_FIELDS = ['level', 'frame', 'instances', 'triangles', 'cpuMs', 'gpuMs']
+
+
+# An OpenGL context with a width x height color and depth framebuffer and no
+# window. It is current from construction until destroy
+class OffscreenContext(object):
+
+    def __init__(self, width, height):
+        self.width = width
+        self.height = height
+
+        self.display = EGL.eglGetDisplay(EGL.EGL_DEFAULT_DISPLAY)
+        major, minor = EGL.EGLint(), EGL.EGLint()
+        if not EGL.eglInitialize(self.display, ctypes.pointer(major), ctypes.pointer(minor)):
+            raise RuntimeError("Unable to initialize EGL.")
+
+        attributes = [EGL.EGL_SURFACE_TYPE, EGL.EGL_PBUFFER_BIT,
+                      EGL.EGL_RENDERABLE_TYPE, EGL.EGL_OPENGL_BIT,
+                      EGL.EGL_NONE]
+        config = EGL.EGLConfig()
+        count = EGL.EGLint()
+        EGL.eglChooseConfig(self.display, (EGL.EGLint * len(attributes))(*attributes),
+                            ctypes.pointer(config), 1, ctypes.pointer(count))
+        if count.value == 0:
+            raise RuntimeError("No EGL config supports desktop OpenGL pbuffers.")
+
+        EGL.eglBindAPI(EGL.EGL_OPENGL_API)
+        self.context = EGL.eglCreateContext(self.display, config, EGL.EGL_NO_CONTEXT, None)
+
+        # Rendering goes to the framebuffer object, the pbuffer is only there
+        # to make the context current
+        size = [EGL.EGL_WIDTH, 1, EGL.EGL_HEIGHT, 1, EGL.EGL_NONE]
+        self.surface = EGL.eglCreatePbufferSurface(self.display, config,
+                                                   (EGL.EGLint * len(size))(*size))
+        EGL.eglMakeCurrent(self.display, self.surface, self.surface, self.context)
+
+        self.framebuffer = glGenFramebuffers(1)
+        self.renderbuffers = glGenRenderbuffers(2)
+        glBindRenderbuffer(GL_RENDERBUFFER, self.renderbuffers[0])
+        glRenderbufferStorage(GL_RENDERBUFFER, GL_RGBA8, width, height)
+        glBindRenderbuffer(GL_RENDERBUFFER, self.renderbuffers[1])
+        glRenderbufferStorage(GL_RENDERBUFFER, GL_DEPTH_COMPONENT24, width, height)
+        glBindRenderbuffer(GL_RENDERBUFFER, 0)
+
+        glBindFramebuffer(GL_FRAMEBUFFER, self.framebuffer)
+        glFramebufferRenderbuffer(GL_FRAMEBUFFER, GL_COLOR_ATTACHMENT0, GL_RENDERBUFFER, self.renderbuffers[0])
+        glFramebufferRenderbuffer(GL_FRAMEBUFFER, GL_DEPTH_ATTACHMENT, GL_RENDERBUFFER, self.renderbuffers[1])
+        status = glCheckFramebufferStatus(GL_FRAMEBUFFER)
+        if status != GL_FRAMEBUFFER_COMPLETE:
+            raise RuntimeError("Offscreen framebuffer is incomplete: 0x%x" % status)
+        glViewport(0, 0, width, height)
+
+    # Release the framebuffer and the context
+    def destroy(self):
+        glBindFramebuffer(GL_FRAMEBUFFER, 0)
+        glDeleteFramebuffers(1, [self.framebuffer])
+        glDeleteRenderbuffers(2, self.renderbuffers)
+        EGL.eglMakeCurrent(self.display, EGL.EGL_NO_SURFACE, EGL.EGL_NO_SURFACE, EGL.EGL_NO_CONTEXT)
+        EGL.eglDestroySurface(self.display, self.surface)
+        EGL.eglDestroyContext(self.display, self.context)
+        EGL.eglTerminate(self.display)
+
+
+# Times frames between begin and end. The CPU time runs until glFinish
+# returns, as a swap would wait for the frame; the GPU time comes from a
+# GL_TIME_ELAPSED query and is None when the driver has no timer
+class FrameTimer(object):
+
+    def __init__(self):
+        self.query = glGenQueries(1)[0]
+        self.hasTimer = glGetQueryiv(GL_TIME_ELAPSED, GL_QUERY_COUNTER_BITS) > 0
+        self._start = None
+
+    def begin(self):
+        self._start = time.time()
+        if self.hasTimer:
+            glBeginQuery(GL_TIME_ELAPSED, self.query)
+
+    # Return (cpu milliseconds, gpu milliseconds or None) of the frame
+    def end(self):
+        if self.hasTimer:
+            glEndQuery(GL_TIME_ELAPSED)
+        glFinish()
+        cpuMs = (time.time() - self._start) * 1000.0
+
+        gpuMs = None
+        if self.hasTimer:
+            # Passing the result explicitly, PyOpenGL cannot allocate the
+            # 64-bit output itself
+            elapsed = ctypes.c_uint64()
+            glGetQueryObjectui64v(self.query, GL_QUERY_RESULT, ctypes.byref(elapsed))
+            gpuMs = elapsed.value / 1e6
+        return cpuMs, gpuMs
+
+
+# Return one row per level of the report rows, with the frame count and the
+# mean CPU and GPU milliseconds of its frames
+def summarize(rows):
+    levels = []
+    for row in rows:
+        if not levels or levels[-1]['level'] != row['level']:
+            levels.append({'level': row['level'], 'triangles': row['triangles'],
+                           'frames': 0, 'cpuMs': 0.0, 'gpuMs': 0.0})
+        summary = levels[-1]
+        summary['frames'] += 1
+        summary['cpuMs'] += row['cpuMs']
+        summary['gpuMs'] = None if row['gpuMs'] is None or summary['gpuMs'] is None \
+            else summary['gpuMs'] + row['gpuMs']
+
+    for summary in levels:
+        summary['cpuMs'] /= summary['frames']
+        if summary['gpuMs'] is not None:
+            summary['gpuMs'] /= summary['frames']
+    return levels
+
+
+# Write the per-frame rows to filename, as JSON if it ends in .json and as
+# CSV with a header line otherwise
+def writeReport(rows, filename):
+    with open(filename, 'w') as f:
+        if filename.lower().endswith('.json'):
+            json.dump({'frames': rows}, f, indent=2, sort_keys=True)
+            return
+
+        f.write(','.join(REPORT_FIELDS) + '\n')
+        for row in rows:
+            f.write(','.join('' if row[field] is None else str(row[field])
+                             for field in REPORT_FIELDS) + '\n')
@@ -0,0 +1,110 @@
+##############################################################################
+# This software is licensed under a modified MIT license. The MIT license itself
+# is unchanged, we have only added an optional beerware clause (based off of
+# Poul-Henning Kamp's Beerware license). That is to say, you have the option
+# of completely disregarding the beerware clause and using this software under
+# the vanilla MIT license if you so wish.
+#
+# Copyright (c) 2013 Chris Gibson
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
+# Optional beerware clause:
+# If we happen to meet in person someday and you think this software is worth
+# it, you are welcome to buy us a round of beers. This clause is entirely
+# optional, and need not be fulfilled for you to fully comply with the terms
+# of this license.
+##############################################################################
+
+import numpy as np
+
+from stencil import StencilTable
+
+
+# Incremental re-subdivision for interactive editing.
+#
+# The refined mesh keeps the stencil table that built it and its transpose,
+# the support of every cage vertex: the refined vertices whose stencils name
+# it. Moving a few cage vertices then only re-evaluates the refined vertices
+# in their supports and reports which parts of the vertex buffer need
+# uploading again. A support covers a fixed patch of the cage surface, so
+# it grows with the refined vertex count, about 4x per level: one vertex of
+# a 32x32 torus moves 25, 169, 841 and 3721 refined vertices at levels 1-4.
+# The saving over a full re-evaluation is the ratio of the cage to that
+# patch, not a constant number of rows.
+#
+# The vertex buffer is kept in the layout of SubdMesh.toIndexedArrays, an
+# (N, 4) float32 array of (x, y, z, 1), so it can go straight to a VBO and be
+# drawn with the quads as an index buffer.
+class IncrementalSubdivision(object):
+
+    def __init__(self, verts, quads, levels=1, technique=2):
+        self.cage = np.array(verts, dtype=np.float64).reshape(-1, 3)
+        self.table = StencilTable.compile(quads, len(self.cage), levels, technique)
+        self.support = self.table.transpose()
+
+        self.quads = self.table.quads
+        self.verts = self.table.evaluate(self.cage)
+
+        self.buffer = np.ones((len(self.verts), 4), dtype=np.float32)
+        self.buffer[:, :3] = self.verts
+
+    # The size in bytes of one vertex in the buffer
+    @property
+    def stride(self):
+        return self.buffer.strides[0]
+
+    # Move the cage vertices at the given indices to an (K, 3) array of
+    # positions, and bring the refined vertices and buffer up to date. Returns
+    # the sorted indices of the refined vertices that changed
+    def moveVertices(self, indices, positions):
+        indices = np.asarray(indices, dtype=np.int64).ravel()
+        positions = np.asarray(positions, dtype=np.float64).reshape(-1, 3)
+        if len(indices) != len(positions):
+            raise ValueError("got %s indices but %s positions" % (len(indices), len(positions)))
+        if np.any((indices < 0) | (indices >= len(self.cage))):
+            raise ValueError("cage vertex index out of range [0, %s)" % len(self.cage))
+
+        self.cage[indices] = positions
+
+        pos, _ = self.support.rowEntries(np.unique(indices))
+        rows = np.unique(self.support.columns[pos])
+
+        self.verts[rows] = self.table.evaluateRows(self.cage, rows)
+        self.buffer[rows, :3] = self.verts[rows]
+        return rows
+
+    # Move a single cage vertex. See moveVertices
+    def moveVertex(self, idx, position):
+        return self.moveVertices([idx], [position])
+
+    # Return the (offset, size) byte ranges of the buffer covering the given
+    # sorted refined vertex indices. Runs separated by at most gap untouched
+    # vertices are merged, trading a few redundant bytes for fewer uploads
+    def dirtyRanges(self, rows, gap=0):
+        rows = np.asarray(rows, dtype=np.int64)
+        if len(rows) == 0:
+            return []
+
+        breaks = np.nonzero(np.diff(rows) > gap + 1)[0]
+        first = rows[np.concatenate([[0], breaks + 1])]
+        last = rows[np.concatenate([breaks, [len(rows) - 1]])]
+
+        stride = self.stride
+        return [(int(a) * stride, int(b - a + 1) * stride) for a, b in zip(first, last)]
@@ -0,0 +1,94 @@
+##############################################################################
+# This software is licensed under a modified MIT license. The MIT license itself
+# is unchanged, we have only added an optional beerware clause (based off of
+# Poul-Henning Kamp's Beerware license). That is to say, you have the option
+# of completely disregarding the beerware clause and using this software under
+# the vanilla MIT license if you so wish.
+#
+# Copyright (c) 2013 Chris Gibson
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
+# Optional beerware clause:
+# If we happen to meet in person someday and you think this software is worth
+# it, you are welcome to buy us a round of beers. This clause is entirely
+# optional, and need not be fulfilled for you to fully comply with the terms
+# of this license.
+##############################################################################
+
+import numpy as np
+
+from refine import WEIGHTS, groupBy, segmentSum
+
+
+# Limit positions of catmull-clark surfaces.
+#
+# Subdividing forever moves every vertex to a point on the smooth limit
+# surface. That point is a weighted sum over the vertex's one ring: the vertex
+# itself, its n edge neighbours and the n far corners of its quads. Every
+# technique in WEIGHTS refines the averages of these three groups by the same
+# 3x3 matrix. The limit weights are the left eigenvector of that matrix for
+# eigenvalue 1, which in closed form is proportional to
+#
+#     (5,  8 * w2 + 7 * w3,  3 * w2 + 2 * w3)
+#
+# for the vertex, all edge neighbours and all far corners. For the original
+# rule (technique 4) this gives the well known (n * n, 4, 1) / (n * (n + 5))
+# per point.
+
+
+# Return the limit weights (vertex, each edge neighbour, each far corner) for
+# an array of valences
+def limitMasks(valence, technique=2):
+    n = np.asarray(valence, dtype=np.float64)
+    w1, w2, w3 = WEIGHTS[technique](n)
+    if not np.allclose(w1 + w2 + w3, 1.0):
+        raise ValueError("technique %s does not preserve positions and has no limit surface" % technique)
+
+    center = 5.0
+    edge = 8.0 * w2 + 7.0 * w3
+    corner = 3.0 * w2 + 2.0 * w3
+    total = center + edge + corner
+
+    return center / total, edge / (n * total), corner / (n * total)
+
+
+# Return the limit positions of the (N, C) vertices of a closed quad mesh, as
+# if it were subdivided forever with the given technique. Vertices no quad uses
+# are left where they are
+def projectToLimit(verts, quads, technique=2):
+    verts = np.asarray(verts, dtype=np.float64)
+    quads = np.asarray(quads, dtype=np.int64).reshape(-1, 4)
+
+    # Every quad corner sees one edge neighbour (the next corner) and one far
+    # corner (the opposite one). On a closed mesh the next corners around a
+    # vertex are all of its edge neighbours, once each
+    order, start = groupBy(quads.ravel(), len(verts))
+    edgeSum = segmentSum(verts[np.roll(quads, -1, axis=1).ravel()[order]], start)
+    cornerSum = segmentSum(verts[np.roll(quads, -2, axis=1).ravel()[order]], start)
+
+    valence = np.diff(start)
+    used = valence > 0
+    a, b, c = limitMasks(valence[used], technique)
+
+    out = verts.copy()
+    out[used] = (a[:, None] * verts[used] +
+                 b[:, None] * edgeSum[used] +
+                 c[:, None] * cornerSum[used])
+    return out
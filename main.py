@@ -11,47 +11,118 @@
 # I take no credit for glfw or shaderutil modules, which were kindly offered
 # into the public domain by Richard Petri. I am simply utilizing his code
 # to display the subd mesh code in the subd module
+#
+# Run with --headless to render a fixed number of frames per subdivision
+# level offscreen, without glfw or a display, and write the frame times to a
+# CSV or JSON report.
 ##############################################################################
 
+import argparse
+import math
 import os
 import sys
-import shaderutil
 import time
 
-from glfw import *
-from OpenGL.arrays.vbo import VBO
+parser = argparse.ArgumentParser(description="OpenGL subdivision surface viewer")
+parser.add_argument("mesh", nargs="?", help="mesh file to show instead of the cube")
+parser.add_argument("--fps", type=float, default=60.0, help="frame rate of the animation in the window")
+parser.add_argument("--shader-cache", default=os.path.join(os.path.expanduser("~"), ".cache", "python-subdiv"),
+                    help="directory keeping linked shader programs between runs, empty to always compile")
+parser.add_argument("--headless", action="store_true",
+                    help="render offscreen and report frame times instead of opening a window")
+parser.add_argument("--frames", type=int, default=100, help="frames rendered per level when headless")
+parser.add_argument("--warmup", type=int, default=5, help="untimed frames before each level when headless")
+parser.add_argument("--levels", type=int, nargs="+", help="levels rendered when headless, all by default")
+parser.add_argument("--instances", type=int, default=0, metavar="N",
+                    help="draw an N x N grid of instances of every level when headless, as the I key does")
+parser.add_argument("--report", default="benchmark.csv",
+                    help="per-frame report written when headless, JSON if it ends in .json")
+args = parser.parse_args()
+
+# The headless module selects PyOpenGL's EGL platform, so it has to be
+# imported before OpenGL is. glfw supplies the GL names otherwise
+if args.headless:
+    from headless import FrameTimer, OffscreenContext, summarize, writeReport
+    from OpenGL.GL import *
+else:
+    from glfw import *
 import glm
+import shaderutil
+from gpumesh import (DoubleBufferedMesh, InstancedMesh, LodPyramid, SubdivisionWorker, budgetLevel,
+                     gridInstances, levelBuffers, lodBuffers)
 from mesh import SubdMesh
+from scheduler import RenderScheduler
+
+# Load a saved mesh if one is given, otherwise build a cube mesh. The cube is
+# shown subdivided twice and moved onto the limit surface; the up and down
+# keys change the level
+if args.mesh:
+    cubeMesh = SubdMesh.load(args.mesh)
+    level = 0
+else:
+    cubeMesh = SubdMesh.buildCube()
+    level = 2
+    #cubeMesh.spherize()
 
-# Build a cube mesh and subdivide it several times
-cubeMesh = SubdMesh.buildCube()
-cubeMesh.subdivide()
-cubeMesh.subdivide()
-cubeMesh.subdivide()
-#cubeMesh.spherize()
+# Subdivision levels the keys can pick from. The deepest is 6, or less if
+# that would take more than quadBudget quads, so a large loaded mesh can not
+# be refined out of memory
+quadBudget = 1 << 17
+minLevel = 0
+maxLevel = min(6, budgetLevel(len(cubeMesh.quadArray()), quadBudget))
 
-# Create a flat array of the subdivided mesh data
-cubedata = cubeMesh.toFloatArray()
+# Builds the buffers of other levels in the background
+worker = None
+
+# Every level at once, for picking a level by distance. The L key switches
+# between this and the level picked with the keys. It is built in the
+# background the first time L is pressed, with as many levels as fit in
+# quadBudget quads
+lodWorker = None
+lodPyramid = None
+useLod = False
+
+# A grid of copies of the starting level, drawn with one instanced call. The
+# I key switches between this and the single mesh
+instances = None
+showInstances = False
+
+# Decides when the window redraws: at the target rate while the cube turns or
+# a level is on its way, on input otherwise. Space pauses the animation
+scheduler = None
 
 # Window width/height
 width = 800
 height = 600
 
-# Camera information
+# Camera information. The mouse wheel moves the eye along its direction
 up = glm.vec3(0, 1, 0)
 eye = glm.vec3(1.0, 1.0, 1.0)
 lookAt = glm.vec3(0, 0, 0)
+fovy = 70
+distance = math.sqrt(3.0)
+wheel = 0
 
 # Global matrices
 modelView = glm.mat4.look_at(eye, lookAt, up)
 modelViewProjection = None
 
+# Rebuild the matrices after the window or the eye changed
+def updateCamera():
+    global modelViewProjection, modelView, eye
+
+    eye = glm.vec3(1.0, 1.0, 1.0).mul_f(distance / math.sqrt(3.0))
+    modelView = glm.mat4.look_at(eye, lookAt, up)
+
+    perspective = glm.mat4.perspective(fovy, float(width) / height, 0.1, 20.0)
+    modelViewProjection = perspective.mul_mat4(modelView)
+
 # Program state
 running = True
 
 # Resize window callback
 def resizeWindow(w, h):
-    global modelViewProjection, modelView, width, height
+    global width, height
 
     # Update width and height
     width = w
@@ -59,33 +130,143 @@ def resizeWindow(w, h):
     glViewport(0, 0, width, height)
 
     # Update matrices
-    perspective = glm.mat4.perspective(70, float(width) / height, 0.1, 10.0)
-    modelViewProjection = perspective.mul_mat4(modelView)
+    updateCamera()
+    scheduler.invalidate()
+
+# Window refresh callback. The window was uncovered and has to be redrawn
+def refreshWindow():
+    scheduler.invalidate()
+
+# Window close callback. Wakes the loop so that it can stop
+def closeWindow():
+    global running
+    running = False
+    scheduler.invalidate()
+    return 1
+
+# Mouse wheel callback. Moves the eye closer or further away
+def mouseWheel(pos):
+    global distance, wheel
+    distance = min(max(distance * 0.9 ** (pos - wheel), 1.2), 12.0)
+    wheel = pos
+    updateCamera()
+    scheduler.invalidate()
 
 # Keypress callback.
 def keypress(key, action):
+    global running, level, useLod, showInstances
+    scheduler.invalidate()
     if key == GLFW_KEY_ESC:
-        global running
         running = False
-    
+
+    if action == GLFW_PRESS and key == GLFW_KEY_SPACE:
+        scheduler.animating = not scheduler.animating
+
+    if action == GLFW_PRESS and key == ord('L'):
+        useLod = not useLod
+        if useLod and lodPyramid is None and not lodWorker.busy:
+            lodWorker.request(quadBudget)
+    if action == GLFW_PRESS and key == ord('I'):
+        showInstances = not showInstances
+
+    # Ask the worker for another level. The current one stays on screen
+    # until the new buffers are uploaded
+    if action == GLFW_PRESS and key in (GLFW_KEY_UP, GLFW_KEY_KP_ADD) and level < maxLevel:
+        level += 1
+        worker.request(level)
+    if action == GLFW_PRESS and key in (GLFW_KEY_DOWN, GLFW_KEY_KP_SUBTRACT) and level > minLevel:
+        level -= 1
+        worker.request(level)
+
+# Clear and draw one frame of the mesh, turned by rotation radians around
+# the up axis
+def drawScene(rotation):
+    glClear(GL_COLOR_BUFFER_BIT | GL_DEPTH_BUFFER_BIT)
+    glUseProgram(prog)
+
+    # Generate a temporary matrix with a rotation added to the mix
+    # I'm not sure why I have to transpose. If I do not, bad things
+    # happen.
+    tmp_mat = modelViewProjection.rotate(rotation, glm.vec3(0, 1, 0)).transpose()
+    glUniformMatrix4fv(mvploc, 1, GL_TRUE, tmp_mat.to_tuple())
+
+    # RENDER the red fill and black wireframe for the model in one pass
+    # -----------------------------------------------------------
+    glUniform4f(colloc, 1, 0, 0, 1)
+    glUniform4f(wireloc, 0, 0, 0, 1)
+
+    # Draw the cube, at the level its size on screen calls for if
+    # picking by distance and the levels are ready
+    if showInstances:
+        glUniform1i(instancedloc, 1)
+        instances.draw(GL_TRIANGLES)
+        glUniform1i(instancedloc, 0)
+    elif useLod and lodPyramid is not None:
+        lodPyramid.select((eye.x, eye.y, eye.z), fovy, height)
+        lodPyramid.draw(GL_TRIANGLES)
+    else:
+        cubeBuffers.draw(GL_TRIANGLES)
+
+# Render frames of every level offscreen and return a report row per frame.
+# The mesh makes one full turn over the timed frames of each level. With
+# instanceRows, every frame draws a grid of that many rows and columns of
+# instances instead
+def benchmark(levels, frames, warmup, instanceRows=0):
+    global instances, showInstances
+    timer = FrameTimer()
+    rows = []
+    instanceCount = max(instanceRows, 1) ** 2
+    for benchLevel in levels:
+        verts, indices = levelBuffers(cubeMesh, benchLevel)
+        if instanceRows:
+            if instances is None:
+                instances = InstancedMesh(verts, indices, attributes=meshAttributes, stride=meshStride,
+                                          modelLocation=modelloc, colorLocation=instcolloc)
+                instances.setInstances(*gridInstances(instanceRows, instanceRows, spacing=0.4, scale=0.12))
+                showInstances = True
+            else:
+                instances.setMesh(verts, indices)
+        else:
+            cubeBuffers.stage(verts, indices, level=benchLevel)
+            while not cubeBuffers.update():
+                pass
+
+        for frame in range(-warmup, frames):
+            timer.begin()
+            drawScene(2 * math.pi * max(frame, 0) / frames)
+            cpuMs, gpuMs = timer.end()
+            if frame >= 0:
+                rows.append({'level': benchLevel, 'frame': frame, 'instances': instanceCount,
+                             'triangles': len(indices) // 3 * instanceCount, 'cpuMs': cpuMs, 'gpuMs': gpuMs})
+    return rows
+
 if __name__ == "__main__":
-    # Something in glfwInit changes the cwd.
-    cwd = os.getcwd()
-    # Initialize
-    if not glfwInit():
-        print >> sys.stderr, "Unable to initialize GLFW."
-        sys.exit(-1)
-    # Restore the old cwd.
-    os.chdir(cwd)
-
-    if not glfwOpenWindow(width, height, 0, 0, 0, 0, 32, 0, GLFW_WINDOW):
-        print >> sys.stderr, "Unable to open Window."
-        glfwTerminate()
-        sys.exit(-1)
-    glfwSetWindowSizeCallback(resizeWindow)
-    glfwSetKeyCallback(keypress)
-    glfwSetWindowTitle("OpenGL Subdivision Surface Test")
-    glfwEnable(GLFW_AUTO_POLL_EVENTS) # Enables the polling for key/mouse events in the swap buffer function!
+    if args.headless:
+        context = OffscreenContext(width, height)
+    else:
+        # Something in glfwInit changes the cwd.
+        cwd = os.getcwd()
+        # Initialize
+        if not glfwInit():
+            print >> sys.stderr, "Unable to initialize GLFW."
+            sys.exit(-1)
+        # Restore the old cwd.
+        os.chdir(cwd)
+
+        if not glfwOpenWindow(width, height, 0, 0, 0, 0, 32, 0, GLFW_WINDOW):
+            print >> sys.stderr, "Unable to open Window."
+            glfwTerminate()
+            sys.exit(-1)
+        # Created first, glfw calls the size callback as soon as it is set
+        scheduler = RenderScheduler(glfwWaitEvents, glfwPollEvents, rate=args.fps,
+                                    clock=glfwGetTime, sleep=glfwSleep)
+        glfwSetWindowSizeCallback(resizeWindow)
+        glfwSetWindowRefreshCallback(refreshWindow)
+        glfwSetWindowCloseCallback(closeWindow)
+        glfwSetKeyCallback(keypress)
+        glfwSetMouseWheelCallback(mouseWheel)
+        glfwSetWindowTitle("OpenGL Subdivision Surface Test")
+        glfwDisable(GLFW_AUTO_POLL_EVENTS) # The scheduler polls or waits for key/mouse events itself
 
     # Print some OpenGL information.
     print "OpenGL Information:"
@@ -98,70 +279,102 @@ if __name__ == "__main__":
     glClearColor(1, 1, 1, 0)
     glPointSize(3)
     # Set up the shader.
-    prog = shaderutil.createProgram("./shader.vs", "./shader.fs")
+    prog = shaderutil.createProgram("./shader.vs", "./shader.fs", cachedir=args.shader_cache or None)
     mvploc = glGetUniformLocation(prog, "mvp")
     colloc = glGetUniformLocation(prog, "color")
+    wireloc = glGetUniformLocation(prog, "wireColor")
+    instancedloc = glGetUniformLocation(prog, "instanced")
     positionloc = glGetAttribLocation(prog, "vs_position")
+    normalloc = glGetAttribLocation(prog, "vs_normal")
+    edgeloc = glGetAttribLocation(prog, "vs_edge")
+    modelloc = glGetAttribLocation(prog, "vs_model")
+    instcolloc = glGetAttribLocation(prog, "vs_color")
     
-    # Setup VAO
-    vertobj = glGenVertexArrays(1)
-    glBindVertexArray(vertobj)
+    # Positions, normals and wireframe edge coordinates are interleaved, 11
+    # floats per vertex (see SubdMesh.toTriangleArrays)
+    meshAttributes = [(positionloc, 4, 0), (normalloc, 3, 4 * 4), (edgeloc, 3, 8 * 4)]
+    meshStride = 11 * 4
 
-    # Setup the VBO
-    vertbuf = VBO(cubedata, GL_STATIC_DRAW)
-    vertbuf.bind()
-    glEnableVertexAttribArray(positionloc)
-    glVertexAttribPointer(positionloc, 4, GL_FLOAT, GL_TRUE, 4 * 4, vertbuf+0)
-    vertbuf.unbind() # We can unbind the VBO, since it's linked to the VAO
+    # Setup the double-buffered vertex and index buffers
+    cubeBuffers = DoubleBufferedMesh(meshAttributes, meshStride)
 
-    running = True
-    t = time.time()
-    rotation = 0.0
-    while running:
-        glClear(GL_COLOR_BUFFER_BIT | GL_DEPTH_BUFFER_BIT)
-        glUseProgram(prog)
+    # Time every level offscreen, write the report and stop
+    if args.headless:
+        updateCamera()
+        rows = benchmark(args.levels or range(minLevel, maxLevel + 1), args.frames, args.warmup, args.instances)
+        writeReport(rows, args.report)
 
-        # Generate a temporary matrix with a rotation added to the mix
-        # I'm not sure why I have to transpose. If I do not, bad things
-        # happen.
-        tmp_mat = modelViewProjection.rotate(rotation, glm.vec3(0, 1, 0)).transpose()
-        glUniformMatrix4fv(mvploc, 1, GL_TRUE, tmp_mat.to_tuple())
+        print "%5s %10s %8s %10s %10s" % ("level", "triangles", "frames", "cpu ms", "gpu ms")
+        for summary in summarize(rows):
+            print "%5d %10d %8d %10.3f %10s" % (summary['level'], summary['triangles'], summary['frames'],
+                                                summary['cpuMs'],
+                                                '-' if summary['gpuMs'] is None else '%.3f' % summary['gpuMs'])
+        print "Wrote %d frames to %s" % (len(rows), args.report)
 
-        # RENDER the red fill for the model
-        # -----------------------------------------------------------
-        glPolygonMode( GL_FRONT_AND_BACK, GL_FILL )
+        context.destroy()
+        sys.exit(0)
 
-        # Set red fill for mesh
-        glUniform4f(colloc, 1, 0, 0, 1)
+    # Upload the first level before the first frame
+    cubeBuffers.stage(*levelBuffers(cubeMesh, level), level=level)
+    while not cubeBuffers.update():
+        pass
 
-        # Offset to allow for proper wireframe display
-        glEnable( GL_POLYGON_OFFSET_FILL );
-        glPolygonOffset( 1, 1 )
+    worker = SubdivisionWorker(cubeMesh)
 
-        # Draw the cube
-        glDrawArrays(GL_QUADS, 0, len(cubeMesh._quads)*4)
+    # A worker of its own, so level requests do not replace the pyramid's
+    lodWorker = SubdivisionWorker(cubeMesh, build=lodBuffers)
 
-        # RENDER the black wireframe for the model
-        # -----------------------------------------------------------
-        glPolygonMode( GL_FRONT_AND_BACK, GL_LINE )
+    # Upload the starting level once and place a 10x10 grid of copies
+    instances = InstancedMesh(*levelBuffers(cubeMesh, level), attributes=meshAttributes, stride=meshStride,
+                              modelLocation=modelloc, colorLocation=instcolloc)
+    instances.setInstances(*gridInstances(10, 10, spacing=0.4, scale=0.12))
 
-        # Disable offset fill
-        glDisable( GL_POLYGON_OFFSET_FILL );
+    running = True
+    t = time.time()
+    rotation = 0.0
+    while running:
+        # Sleep until the next frame is due or an event asks for one
+        scheduler.waitForFrame(busy=worker.busy or lodWorker.busy or cubeBuffers.uploading)
+        if not running:
+            break
 
-        # Set black color for wireframe
-        glUniform4f(colloc, 0, 0, 0, 1)
+        # Pick up a finished level and copy the next slice of it to the GPU.
+        # If the level failed to build, keep the one on screen
+        try:
+            result = worker.takeResult()
+        except Exception as error:
+            print >> sys.stderr, "Unable to build the level: %s" % error
+            level = cubeBuffers.level
+            result = None
+        if result is not None:
+            newLevel, newVerts, newIndices = result
+            cubeBuffers.stage(newVerts, newIndices, level=newLevel)
+        cubeBuffers.update()
 
-        # Draw the cube
-        glDrawArrays(GL_QUADS, 0, len(cubeMesh._quads)*4)
+        # Upload every level for distance-based picking once they are built
+        try:
+            result = lodWorker.takeResult()
+        except Exception as error:
+            print >> sys.stderr, "Unable to build the levels: %s" % error
+            result = None
+        if result is not None:
+            budget, levelVerts, levelIndices = result
+            lodPyramid = LodPyramid(cubeMesh, levelVerts, levelIndices, meshAttributes, meshStride)
 
-        # UPDATE the rotation based on render time
+        # UPDATE the rotation based on render time, holding still while paused
         # -----------------------------------------------------------
-        rotation += (time.time() - t) / 15 * (2 * 3.1416)
-        t = time.time()
+        now = time.time()
+        if scheduler.animating:
+            rotation += (now - t) / 15 * (2 * 3.1416)
+        t = now
+
+        drawScene(rotation)
 
         # Stop running if window gets closed.
         running = running and glfwGetWindowParam(GLFW_OPENED)
 
         glfwSwapBuffers()
         
+    worker.stop()
+    lodWorker.stop()
     glfwTerminate()
\ No newline at end of file
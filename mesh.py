@@ -35,38 +35,266 @@
 from glm import vec3
 import numpy as np
 
+import meshio
+from adaptive import refineAdaptive
+from deform import Pipeline, Spherize
+from evaluator import LimitEvaluator
+from incremental import IncrementalSubdivision
+from limit import projectToLimit
+from normals import faceNormals, limitNormals, vertexNormals
+from parallel import subdivideParallel
+from profiling import NULL_PROFILE
+from refine import Refinement, WEIGHTS, subdivideBatch
+from stencil import StencilTable
+
+
+# Return the (x, y, z) of a vec3 or any 3-sequence
+def _xyz(v):
+    if hasattr(v, 'x'):
+        return (v.x, v.y, v.z)
+    return tuple(v)
+
+
+# Return a copy of a storage array with room for at least the given number of
+# rows, doubling its capacity
+def _grow(data, rows):
+    grown = np.empty((max(rows, 2 * len(data), 16),) + data.shape[1:], dtype=data.dtype)
+    grown[:len(data)] = data
+    return grown
+
 
 class SubdMesh(object):
 
-    def __init__(self):
-        self._vertices = []
-        self._quads = []
+    def __init__(self, dtype=np.float64):
+        # Vertices and quads are kept in arrays that grow by doubling, so adding
+        # one is an amortized append. Only the first _vertexCount/_quadCount
+        # rows are in use
+        self._vertexData = np.empty((0, 3), dtype=dtype)
+        self._vertexCount = 0
+        self._quadData = np.empty((0, 4), dtype=np.int32)
+        self._quadCount = 0
+
+        # Topology index, built when first needed and then kept in sync by
+        # addQuad. Maps a vertex to the quads using it, and an edge (smaller
+        # index first) to the quads bordering it
+        self._vertQuads = None
+        self._edgeQuads = None
+
+    # The vertices in use, as an (N, 3) view of the storage
+    @property
+    def _vertices(self):
+        return self._vertexData[:self._vertexCount]
+
+    # The quads in use, as an (F, 4) view of the storage
+    @property
+    def _quads(self):
+        return self._quadData[:self._quadCount]
 
     # Add a vertex to the mesh
     def addVertex(self, v):
-        self._vertices.append(v)
-        return len(self._vertices) - 1
+        if self._vertexCount == len(self._vertexData) or not self._vertexData.flags.writeable:
+            self._vertexData = _grow(self._vertexData, self._vertexCount + 1)
+
+        self._vertexData[self._vertexCount] = _xyz(v)
+        self._vertexCount += 1
+        return self._vertexCount - 1
+
+    # Return the vertex at the given index
+    def vertex(self, idx):
+        return vec3(*self._vertices[idx].tolist())
+
+    # Move the vertex at the given index
+    def setVertex(self, idx, v):
+        self._writableVertices()[idx] = _xyz(v)
 
     # Add a quad to the mesh
     def addQuad(self, v1, v2, v3, v4):
 
         for idx in [v1,v2,v3,v4]:
-            if idx > len(self._vertices):
-                raise ValueError("idx %s is out-of-bounds (> %s)" % (idx,len(self._vertices)))
+            if idx >= self._vertexCount:
+                raise ValueError("idx %s is out-of-bounds (>= %s)" % (idx,self._vertexCount))
+
+        if self._quadCount == len(self._quadData) or not self._quadData.flags.writeable:
+            self._quadData = _grow(self._quadData, self._quadCount + 1)
+
+        self._quadData[self._quadCount] = [v1, v2, v3, v4]
+        self._quadCount += 1
+
+        quadIdx = self._quadCount - 1
+        if self._vertQuads is not None:
+            self._indexQuad(quadIdx, [v1, v2, v3, v4])
+        return quadIdx
+
+    # Add the given quad to the topology index
+    def _indexQuad(self, quadIdx, quadVerts):
+        polySize = len(quadVerts)
+
+        for i, idx in enumerate(quadVerts):
+            self._vertQuads.setdefault(idx, []).append(quadIdx)
+
+            idx2 = quadVerts[(i+1) % polySize]
+            self._edgeQuads.setdefault((min(idx, idx2), max(idx, idx2)), []).append(quadIdx)
+
+    # Build the topology index if it isn't there yet
+    def _index(self):
+        if self._vertQuads is None:
+            self._vertQuads = {}
+            self._edgeQuads = {}
+
+            for quadIdx, quadVerts in enumerate(self._quads.tolist()):
+                self._indexQuad(quadIdx, quadVerts)
+
+    # Replace all quads of the mesh. The topology index is rebuilt when next needed
+    def _setQuads(self, quads, copy=True):
+        quads = np.asarray(quads).reshape(-1, 4)
+        if copy or quads.dtype != np.int32:
+            quads = np.array(quads, dtype=np.int32)
+
+        self._quadData = quads
+        self._quadCount = len(quads)
+        self._vertQuads = None
+        self._edgeQuads = None
+
+    # Return the vertex storage, copying it first if it is read-only (such as a
+    # memory-mapped file)
+    def _writableVertices(self):
+        if not self._vertexData.flags.writeable:
+            self._vertexData = np.array(self._vertices)
+        return self._vertices
+
+    # Return a flat array based on the mesh data, with every quad corner written
+    # out separately as (x, y, z, 1)
+    def toFloatArray(self):
+        verts, indices = self.toIndexedArrays()
+        return verts[indices].ravel()
+
+    # Return the mesh as an indexed buffer pair: an (N, 4) float32 array of
+    # unique (x, y, z, 1) vertices and a flat uint32 array of quad corner indices
+    def toIndexedArrays(self):
+        verts = np.ones((self._vertexCount, 4), dtype=np.float32)
+        verts[:, :3] = self.vertexArray()
+
+        return verts, self.quadArray().astype(np.uint32).ravel()
+
+    # Return the mesh as an interleaved buffer pair: an (N, 8) float32 array of
+    # (x, y, z, 1, nx, ny, nz, 0) vertices and a flat uint32 array of quad
+    # corner indices. normals picks 'vertex' (area-weighted) or 'limit' normals
+    def toInterleavedArrays(self, normals='vertex'):
+        verts, indices = self.toIndexedArrays()
+
+        interleaved = np.zeros((len(verts), 8), dtype=np.float32)
+        interleaved[:, :4] = verts
+        if normals == 'vertex':
+            interleaved[:, 4:7] = self.vertexNormals()
+        elif normals == 'limit':
+            interleaved[:, 4:7] = self.limitNormals()
+        else:
+            raise ValueError("unknown normals '%s'" % normals)
+
+        return interleaved, indices
+
+    # Return the mesh as triangles for single-pass fill and wireframe drawing:
+    # an (N, 11) float32 array of (x, y, z, 1, nx, ny, nz, 0, ex, ey, ez)
+    # vertices and a flat uint32 array of triangle corner indices, two
+    # triangles per quad split along the corner 0 - corner 2 diagonal and one
+    # per triangle (a quad whose last corner repeats the third).
+    #
+    # Interpolated, min(ex, ey, ez) is zero along the edges of every face but
+    # not inside it, which lets the fragment shader draw the wireframe. On a
+    # quad, (ex, ey) is (1, 0) at corner 0, (0, 1) at corner 2 and (0, 0) at
+    # the others, and ez is 1, so the diagonal is not drawn. A triangle's
+    # corners get (1, 0, 0), (0, 1, 0) and (0, 0, 1), zero along all three
+    # edges. Subdivided meshes have every vertex in the same corner of all its
+    # quads (face points first, old vertices third), so the vertices stay
+    # shared. Triangles, and quads that disagree with their neighbours on a
+    # corner, get vertices of their own
+    def toTriangleArrays(self, normals='vertex'):
+        verts, indices = self.toInterleavedArrays(normals)
+        faces = indices.reshape(-1, 4)
+        isTriangle = faces[:, 2] == faces[:, 3]
+        quads = faces[~isTriangle]
+        triangles = faces[isTriangle, :3]
+
+        # The role of every quad corner, and the (ex, ey, ez) of every role.
+        # Roles 3 to 5 are the corners of triangles
+        cornerRole = np.array([0, 1, 2, 1])
+        triangleRole = np.array([3, 4, 5])
+        roleEdge = np.array([[1, 0, 1], [0, 0, 1], [0, 1, 1],
+                             [1, 0, 0], [0, 1, 0], [0, 0, 1]], dtype=np.float32)
+
+        roles = np.zeros(len(verts), dtype=np.int64)
+        for corner in range(4):
+            roles[quads[:, corner]] = cornerRole[corner]
+
+        conflicts = np.any(roles[quads] != cornerRole, axis=1)
+        shared = quads[~conflicts]
+        conflictCount = int(conflicts.sum())
+        copied = np.concatenate([quads[conflicts].ravel(), triangles.ravel()])
+        copiedRoles = np.concatenate([np.tile(cornerRole, conflictCount),
+                                      np.tile(triangleRole, len(triangles))])
+
+        out = np.empty((len(verts) + len(copied), 11), dtype=np.float32)
+        out[:len(verts), :8] = verts
+        out[:len(verts), 8:] = roleEdge[roles]
+        out[len(verts):, :8] = verts[copied]
+        out[len(verts):, 8:] = roleEdge[copiedRoles]
+
+        copiedQuads = len(verts) + np.arange(4 * conflictCount).reshape(-1, 4)
+        copiedTriangles = len(verts) + 4 * conflictCount + np.arange(3 * len(triangles))
+        quads = np.concatenate([shared, copiedQuads])
+        return out, np.concatenate([quads[:, [0, 1, 2, 0, 2, 3]].ravel(), copiedTriangles]).astype(np.uint32)
+
+    # Return the (F, 3) unit normals of the quads
+    def faceNormals(self):
+        return faceNormals(self.vertexArray(), self.quadArray())
+
+    # Return the (N, 3) area-weighted unit normals of the vertices
+    def vertexNormals(self):
+        return vertexNormals(self.vertexArray(), self.quadArray())
+
+    # Return the (N, 3) unit normals of the limit surface at the vertices,
+    # under the original catmull-clark rule (technique 4)
+    def limitNormals(self):
+        return limitNormals(self.vertexArray(), self.quadArray())
+
+    # Return the vertices as an (N, 3) array. This is a view of the mesh's own
+    # storage, not a copy
+    def vertexArray(self):
+        return self._vertices
+
+    # Return the quads as an (F, 4) array of vertex indices. This is a view of
+    # the mesh's own storage, not a copy
+    def quadArray(self):
+        return self._quads
+
+    # Return a mesh with the given (N, 3) vertices and (F, 4) quads. With copy
+    # False the mesh uses the arrays as they are where it can, which lets a
+    # memory-mapped file back a mesh without being read in
+    @classmethod
+    def fromArrays(cls, verts, quads, copy=True):
+        msh = cls()
+        msh._setArrays(verts, quads, copy)
+        return msh
 
-        self._quads.append([v1, v2, v3, v4])
-        return len(self._quads) - 1
+    # Replace all vertices and quads of the mesh with the given arrays
+    def _setArrays(self, verts, quads, copy=True):
+        verts = np.asarray(verts).reshape(-1, 3)
+        if copy or verts.dtype.kind != 'f':
+            verts = np.array(verts, dtype=self._vertexData.dtype)
 
-    # Return a flat array based on the mesh data
-    def toFloatArray(self):
-        array = []
+        self._vertexData = verts
+        self._vertexCount = len(verts)
+        self._setQuads(quads, copy)
 
-        for quad in self._quads:
-            for idx in quad:
-                v = self._vertices[idx]
-                array.extend([v.x, v.y, v.z, 1])
+    # Save the mesh to a binary mesh file (see meshio)
+    def save(self, path):
+        meshio.save(path, self.vertexArray(), self.quadArray())
 
-        return np.array(array, dtype=np.float32)
+    # Load a mesh from a binary mesh file (see meshio). The mesh is backed by
+    # the file itself until it is changed
+    @classmethod
+    def load(cls, path):
+        return cls.fromArrays(*meshio.load(path), copy=False)
 
     # Return a cube mesh
     @classmethod
@@ -97,16 +325,20 @@ class SubdMesh(object):
     def midpoint(self, *indices):
         mpoint = vec3(0, 0, 0)
         for idx in indices:
-            mpoint = mpoint.add(self._vertices[idx])
+            mpoint = mpoint.add(self.vertex(idx))
 
         return mpoint.div_f(len(indices))
 
     # Find all faces that contain the given indices
     def quadsContain(self, *indices):
-        connected = []
+        if not indices:
+            return list(range(self._quadCount))
 
-        # For every quad
-        for curQuad, quadVerts in enumerate(self._quads, 0):
+        # Only the quads around the first vertex can contain all of them
+        self._index()
+        connected = []
+        for curQuad in self._vertQuads.get(indices[0], []):
+            quadVerts = self._quads[curQuad].tolist()
 
             # If every indice exists in the quad, add it to our list
             for idx in indices:
@@ -117,27 +349,54 @@ class SubdMesh(object):
 
         return connected
 
+    # Find the faces on either side of the edge between two vertices
+    def edgeQuads(self, idx, idx2):
+        self._index()
+        return list(self._edgeQuads.get((min(idx, idx2), max(idx, idx2)), []))
+
     # Return any vertices that are connected via edge to the given vertId
     def connectedVerts(self, vertIdx):
         connectedVertIndices = []
 
-        # For every quad in the mesh
-        for quadVerts in self._quads:
+        # For every quad around the vertex
+        self._index()
+        for curQuad in self._vertQuads.get(vertIdx, []):
+            quadVerts = self._quads[curQuad].tolist()
             polySize = len(quadVerts)
 
-            # If the vertexId exists in the quad
-            if vertIdx in quadVerts:
-
-                # Find those in the quad loop on each side
-                quadIdx = quadVerts.index(vertIdx)
-                connectedVertIndices.append(quadVerts[(quadIdx-1) % polySize])
-                connectedVertIndices.append(quadVerts[(quadIdx+1) % polySize])
+            # Find those in the quad loop on each side
+            quadIdx = quadVerts.index(vertIdx)
+            connectedVertIndices.append(quadVerts[(quadIdx-1) % polySize])
+            connectedVertIndices.append(quadVerts[(quadIdx+1) % polySize])
 
         # Return only unique results (we don't care about order)
         return list(set(connectedVertIndices))
 
-    # Subdivide the current mesh by one level
-    def subdivide(self):
+    # Subdivide the current mesh by one level. The 'python' engine walks the mesh
+    # one element at a time, the 'numpy' engine runs every step over whole arrays
+    # and the 'parallel' engine splits the numpy steps, topology included, over
+    # a pool of the given number of worker processes, kept for later calls.
+    # All give the same mesh. technique picks the
+    # vertex weights (see WEIGHTS). Pass a profiling.SubdivisionProfile as
+    # profile to record how long each step takes
+    def subdivide(self, engine='python', technique=2, workers=None, profile=None):
+        if engine not in ('python', 'numpy', 'parallel'):
+            raise ValueError("unknown subdivision engine '%s'" % engine)
+
+        profile = profile or NULL_PROFILE
+        profile.beginLevel(engine, len(self._vertices), len(self._quads))
+
+        if engine == 'python':
+            self._subdividePython(technique, profile)
+        elif engine == 'numpy':
+            self._subdivideNumpy(technique, profile)
+        else:
+            self._subdivideParallel(technique, workers, profile)
+
+        profile.endLevel()
+
+    # Subdivide the mesh by one level, one element at a time
+    def _subdividePython(self, technique, profile):
 
         # A list of the new quads we will be creating. We will replace the old quads
         # with these when we're done
@@ -149,24 +408,27 @@ class SubdMesh(object):
         quadCtrList = []
 
         oldVertexCount = len(self._vertices)
+        quads = self._quads.tolist()
 
         # STEP ONE: Generate face points
         # -----------------------------------------------------------
-        for quadVerts in self._quads:
+        for quadVerts in quads:
             polyCount = len(quadVerts)
             # create the center point
             ctr = vec3(0, 0, 0)
             for idx in quadVerts:
-                ctr = ctr.add(self._vertices[idx])
+                ctr = ctr.add(self.vertex(idx))
             ctr = ctr.div_f(polyCount)
 
             centerIdx = self.addVertex(ctr)
 
             quadCtrList.append(centerIdx)
 
+        profile.phase('face points', len(quadCtrList))
+
         # STEP TWO: Generate edge points
         # -----------------------------------------------------------
-        for curQuad, quadVerts in enumerate(self._quads, 0):
+        for curQuad, quadVerts in enumerate(quads, 0):
             polyCount = len(quadVerts)
 
             # create center points for every edge
@@ -182,7 +444,7 @@ class SubdMesh(object):
                     idx2 = tmp
 
                 # if we don't have an entry, add one
-                if not idx in edgeMids.keys():
+                if not idx in edgeMids:
                     edgeMids[idx] = {}
 
                 # if we haven't already created this edge midpoint while working
@@ -193,13 +455,15 @@ class SubdMesh(object):
                     # as the new face points in the quads this edge straddles
 
                     # First, find those quads
-                    connectedQuads = self.quadsContain(idx, idx2)
+                    connectedQuads = self.edgeQuads(idx, idx2)
                     assert len(connectedQuads) == 2
 
                     avg = self.midpoint(idx, idx2, quadCtrList[connectedQuads[0]], quadCtrList[connectedQuads[1]])
 
                     edgeMids[idx][idx2] = self.addVertex(avg)
 
+        profile.phase('edge points', len(self._vertices) - oldVertexCount - len(quadCtrList))
+
         # STEP THREE: Modify the existing vertices
         # -----------------------------------------------------------
         for idx in range(oldVertexCount):
@@ -209,7 +473,7 @@ class SubdMesh(object):
                 n = float(len(connectedQuads))
 
                 # M1: Generate old coord weight
-                m1 = self._vertices[idx]
+                m1 = self.vertex(idx)
 
                 # M2: Generate average face points weight
                 m2 = self.midpoint(*[quadCtrList[quadIdx] for quadIdx in connectedQuads])
@@ -234,33 +498,20 @@ class SubdMesh(object):
 
                 m3 = self.midpoint(*connectedEdgeMids)
 
-                # Weights (for easy modification)
-                # There are many methods of weighing the various elements
-
-                # Technique 1
-                #w1 = (n - 3.0) / n
-                #w2 = 1.0 / n
-                #w3 = 2.0 / n
-
-                # Technique 2
-                w1 = (n - 2.5) / n
-                w2 = 1.0 / n
-                w3 = 1.5 / n
-
-                # Technique 3
-                #w1 = ((4.0 * n) - 7.0) / (4.0 * n)
-                #w2 = 1.0 / (4.0 * (n * n))
-                #w3 = 1.0 / (2.0 * (n * n))
+                # Weights (for easy modification, see WEIGHTS)
+                w1, w2, w3 = WEIGHTS[technique](n)
 
                 m1 = m1.mul_f(w1)
                 m2 = m2.mul_f(w2)
                 m3 = m3.mul_f(w3)
 
-                self._vertices[idx] = m1.add(m2).add(m3)
+                self.setVertex(idx, m1.add(m2).add(m3))
+
+        profile.phase('vertex points', oldVertexCount)
 
         # STEP FOUR: Create new quads
         # -----------------------------------------------------------
-        for curQuad, quadVerts in enumerate(self._quads, 0):
+        for curQuad, quadVerts in enumerate(quads, 0):
             polyCount = len(quadVerts)
 
             # create four new quads in the new quad data-structure
@@ -283,16 +534,98 @@ class SubdMesh(object):
 
                 newQuads.append([centerIdx, mpoint1, idx1, mpoint2])
 
+        profile.phase('new quads', len(newQuads))
+
         # STEP FIVE: Rebuild quads
         # -----------------------------------------------------------
-        self._quads = []
-
-        for quad in newQuads:
-            self.addQuad(*quad)
+        self._setQuads(newQuads)
+
+        profile.phase('rebuild', len(newQuads))
+
+    # Subdivide the mesh by one level, running each step over whole arrays
+    def _subdivideNumpy(self, technique, profile):
+        verts = np.asarray(self.vertexArray(), dtype=np.float64)
+        refinement = Refinement(self.quadArray(), len(verts))
+        profile.phase('topology', refinement.edgeCount)
+
+        facePts = refinement.facePoints(verts)
+        profile.phase('face points', len(facePts))
+
+        edgePts = refinement.edgePoints(verts, facePts)
+        profile.phase('edge points', len(edgePts))
+
+        vertPts = refinement.vertexPoints(verts, facePts, edgePts, technique)
+        profile.phase('vertex points', len(vertPts))
+
+        quads = refinement.refinedQuads()
+        profile.phase('new quads', len(quads))
+
+        verts = np.concatenate([vertPts, facePts, edgePts]).astype(self._vertexData.dtype, copy=False)
+        self._setArrays(verts, quads, copy=False)
+        profile.phase('rebuild', len(quads))
+
+    # Subdivide the mesh by one level over a pool of worker processes
+    def _subdivideParallel(self, technique, workers, profile):
+        verts, quads = subdivideParallel(self.quadArray(), self.vertexArray(), workers,
+                                         technique, profile)
+        self._setArrays(verts.astype(self._vertexData.dtype, copy=False), quads, copy=False)
+        profile.phase('rebuild', len(quads))
+
+    # Subdivide the mesh only where it is needed, the given number of times.
+    # A face is refined when its edges would bend by more than tolerance, in
+    # model units or, given a camera as (eye, fovy in degrees, viewport height),
+    # in pixels. A tolerance of 0 refines everything like subdivide. Faces next
+    # to refined ones are split to match, which leaves some triangles, stored as
+    # quads with a repeated last corner (see adaptive)
+    def subdivideAdaptive(self, tolerance, levels=1, camera=None, technique=2):
+        verts = np.asarray(self.vertexArray(), dtype=np.float64)
+        quads = self.quadArray()
+
+        for level in range(levels):
+            verts, quads = refineAdaptive(verts, quads, tolerance, camera, technique)
+
+        self._setArrays(verts.astype(self._vertexData.dtype, copy=False), quads, copy=False)
+
+    # Subdivide several poses of this mesh's topology at once, leaving the mesh
+    # itself untouched. positions is a (K, N, 3) array, one set of vertex
+    # positions per pose. Returns the (K, N', 3) refined positions and the
+    # (F', 4) refined quads they share
+    def subdividePoses(self, positions, levels=1, technique=2):
+        if np.shape(positions)[1:2] != (len(self._vertices),):
+            raise ValueError("every pose needs %s vertices" % len(self._vertices))
+
+        return subdivideBatch(self.quadArray(), positions, levels, technique)
+
+    # Compile the stencils of subdividing this mesh's topology the given number of
+    # times. The table maps any cage positions to the refined positions
+    def stencilTable(self, levels, technique=2):
+        return StencilTable.compile(self.quadArray(), len(self._vertices), levels, technique)
+
+    # Subdivide a copy of this mesh the given number of times, keeping what is
+    # needed to update the refined mesh cheaply when cage vertices move (see
+    # incremental). The mesh itself is left untouched
+    def incremental(self, levels=1, technique=2):
+        return IncrementalSubdivision(self.vertexArray(), self.quadArray(), levels, technique)
+
+    # Move every vertex to its position on the limit surface, where it would
+    # end up if the mesh were subdivided forever with the given technique
+    def projectToLimit(self, technique=2):
+        self._writableVertices()[:] = projectToLimit(self.vertexArray(), self.quadArray(), technique)
+
+    # Return an evaluator of this mesh's limit surface under the original
+    # catmull-clark rule (technique 4), for repeated evaluate calls
+    def limitEvaluator(self):
+        return LimitEvaluator(self.vertexArray(), self.quadArray())
+
+    # Return the limit positions and u and v derivatives, each (S, 3), at arrays
+    # of quad indices and (u, v) parameters in [0, 1] (see evaluator)
+    def evaluateLimit(self, faces, u, v):
+        return self.limitEvaluator().evaluate(faces, u, v)
+
+    # Run the given deformers (see deform) over all vertices, in place
+    def deform(self, *deformers):
+        Pipeline(*deformers).apply(self._writableVertices())
 
     # Snap all vertices to a sphere with the specified radius
     def spherize(self, radius=1.0):
-        print "running"
-        for i in range(len(self._vertices)):
-            vec = self._vertices[i].normalize()
-            self._vertices[i] = vec.mul_f(radius)
+        self.deform(Spherize(radius))
@@ -0,0 +1,117 @@
+##############################################################################
+# This software is licensed under a modified MIT license. The MIT license itself
+# is unchanged, we have only added an optional beerware clause (based off of
+# Poul-Henning Kamp's Beerware license). That is to say, you have the option
+# of completely disregarding the beerware clause and using this software under
+# the vanilla MIT license if you so wish.
+#
+# Copyright (c) 2013 Chris Gibson
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
+# Optional beerware clause:
+# If we happen to meet in person someday and you think this software is worth
+# it, you are welcome to buy us a round of beers. This clause is entirely
+# optional, and need not be fulfilled for you to fully comply with the terms
+# of this license.
+##############################################################################
+
+import struct
+
+import numpy as np
+
+
+# Binary mesh format, all values little-endian:
+#
+#   header   magic 'SUBDMESH', format version, flags (unused, 0),
+#            vertex count, quad count, vertex block offset, quad block offset
+#   vertices vertex count * 3 float32 (x, y, z)
+#   quads    quad count * 4 int32 vertex indices
+#
+# Blocks start on BLOCK_ALIGN byte boundaries so they can be memory-mapped
+# and used in place.
+MAGIC = b'SUBDMESH'
+VERSION = 1
+HEADER = struct.Struct('<8sIIQQQQ')
+BLOCK_ALIGN = 64
+
+VERTEX_TYPE = np.dtype('<f4')
+QUAD_TYPE = np.dtype('<i4')
+
+
+def _align(offset):
+    return (offset + BLOCK_ALIGN - 1) // BLOCK_ALIGN * BLOCK_ALIGN
+
+
+# Write (N, 3) vertices and (F, 4) quads to the given path
+def save(path, verts, quads):
+    verts = np.asarray(verts).reshape(-1, 3)
+    quads = np.asarray(quads).reshape(-1, 4)
+
+    if len(quads) and (quads.min() < 0 or quads.max() >= len(verts)):
+        raise ValueError("quad indices out of range for %s vertices" % len(verts))
+    if len(verts) > np.iinfo(QUAD_TYPE).max:
+        raise ValueError("too many vertices for int32 quad indices: %s" % len(verts))
+
+    vertexOffset = _align(HEADER.size)
+    quadOffset = _align(vertexOffset + len(verts) * 3 * VERTEX_TYPE.itemsize)
+
+    with open(path, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, VERSION, 0, len(verts), len(quads), vertexOffset, quadOffset))
+
+        f.seek(vertexOffset)
+        f.write(np.ascontiguousarray(verts, dtype=VERTEX_TYPE).tobytes())
+
+        f.seek(quadOffset)
+        f.write(np.ascontiguousarray(quads, dtype=QUAD_TYPE).tobytes())
+
+
+# Read the header of the given file. Returns (vertex count, quad count,
+# vertex block offset, quad block offset)
+def readHeader(path):
+    with open(path, 'rb') as f:
+        data = f.read(HEADER.size)
+
+    if len(data) < HEADER.size:
+        raise ValueError("%s is too short to be a mesh file" % path)
+
+    magic, version, flags, vertexCount, quadCount, vertexOffset, quadOffset = HEADER.unpack(data)
+    if magic != MAGIC:
+        raise ValueError("%s is not a mesh file" % path)
+    if version != VERSION:
+        raise ValueError("%s has unsupported format version %s" % (path, version))
+
+    return vertexCount, quadCount, vertexOffset, quadOffset
+
+
+# Memory-map the given file. Returns read-only (N, 3) float32 vertices and
+# (F, 4) int32 quads backed by the file itself, so nothing is read up front
+def load(path):
+    vertexCount, quadCount, vertexOffset, quadOffset = readHeader(path)
+
+    verts = _map(path, VERTEX_TYPE, vertexOffset, (vertexCount, 3))
+    quads = _map(path, QUAD_TYPE, quadOffset, (quadCount, 4))
+    return verts, quads
+
+
+def _map(path, dtype, offset, shape):
+    # np.memmap refuses empty maps
+    if shape[0] == 0:
+        return np.empty(shape, dtype=dtype)
+    return np.memmap(path, dtype=dtype, mode='r', offset=offset, shape=shape)
@@ -0,0 +1,98 @@
+##############################################################################
+# This software is licensed under a modified MIT license. The MIT license itself
+# is unchanged, we have only added an optional beerware clause (based off of
+# Poul-Henning Kamp's Beerware license). That is to say, you have the option
+# of completely disregarding the beerware clause and using this software under
+# the vanilla MIT license if you so wish.
+#
+# Copyright (c) 2013 Chris Gibson
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
+# Optional beerware clause:
+# If we happen to meet in person someday and you think this software is worth
+# it, you are welcome to buy us a round of beers. This clause is entirely
+# optional, and need not be fulfilled for you to fully comply with the terms
+# of this license.
+##############################################################################
+
+import numpy as np
+
+from evaluator import LimitEvaluator
+from refine import groupBy
+
+
+# Return the (F, 3) normals of the quads. Unit length, or with area True,
+# as long as the quad's area. Both come from the cross product of the
+# diagonals, which works for quads that are not flat and for triangles stored
+# as quads with a repeated corner
+def faceNormals(verts, quads, area=False):
+    verts = np.asarray(verts, dtype=np.float64)
+    quads = np.asarray(quads, dtype=np.int64).reshape(-1, 4)
+
+    normals = np.cross(verts[quads[:, 2]] - verts[quads[:, 0]],
+                       verts[quads[:, 3]] - verts[quads[:, 1]])
+    normals *= 0.5
+    if not area:
+        _normalize(normals)
+    return normals
+
+
+# Return the (N, 3) unit vertex normals, the sum of the area-weighted normals
+# of the quads around every vertex. Vertices no quad uses get a zero normal
+def vertexNormals(verts, quads):
+    quads = np.asarray(quads, dtype=np.int64).reshape(-1, 4)
+    areaNormals = faceNormals(verts, quads, area=True)
+
+    normals = np.zeros((len(verts), 3))
+    for corner in range(4):
+        for axis in range(3):
+            normals[:, axis] += np.bincount(quads[:, corner], weights=areaNormals[:, axis],
+                                            minlength=len(verts))
+    return _normalize(normals)
+
+
+# Return the (N, 3) unit normals of the limit surface at every vertex, under
+# the original catmull-clark rule (see evaluator). Vertices no quad uses get
+# a zero normal
+def limitNormals(verts, quads, evaluator=None):
+    quads = np.asarray(quads, dtype=np.int64).reshape(-1, 4)
+    if evaluator is None:
+        evaluator = LimitEvaluator(verts, quads)
+
+    # Evaluate every vertex at one of its quad corners
+    order, start = groupBy(quads.ravel(), len(verts))
+    used = np.nonzero(np.diff(start))[0]
+    corners = order[start[used]]
+
+    u = np.array([0.0, 1.0, 1.0, 0.0])[corners % 4]
+    v = np.array([0.0, 0.0, 1.0, 1.0])[corners % 4]
+    _, du, dv = evaluator.evaluate(corners // 4, u, v)
+
+    normals = np.zeros((len(verts), 3))
+    normals[used] = np.cross(du, dv)
+    return _normalize(normals)
+
+
+# Normalize the rows of an (N, 3) array in place, leaving zero rows alone
+def _normalize(vectors):
+    length = np.sqrt(np.einsum('ij,ij->i', vectors, vectors))
+    np.divide(1.0, length, out=length, where=length > 0)
+    vectors *= length[:, None]
+    return vectors
@@ -0,0 +1,415 @@
+##############################################################################
+# This software is licensed under a modified MIT license. The MIT license itself
+# is unchanged, we have only added an optional beerware clause (based off of
+# Poul-Henning Kamp's Beerware license). That is to say, you have the option
+# of completely disregarding the beerware clause and using this software under
+# the vanilla MIT license if you so wish.
+#
+# Copyright (c) 2013 Chris Gibson
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
+# Optional beerware clause:
+# If we happen to meet in person someday and you think this software is worth
+# it, you are welcome to buy us a round of beers. This clause is entirely
+# optional, and need not be fulfilled for you to fully comply with the terms
+# of this license.
+##############################################################################
+
+import atexit
+import multiprocessing
+import os
+import shutil
+import tempfile
+
+import numpy as np
+
+from fileutil import replaceFile
+from profiling import NULL_PROFILE
+from refine import Refinement
+
+
+# Refining one level over a pool of worker processes.
+#
+# Every array a step needs, the topology included, lives in a .npy file that
+# the parent and the workers all memory-map, in /dev/shm where there is one.
+# Tasks name the files they read, so one pool serves any number of levels and
+# meshes. Each step is split into ranges of quads, half edges, edges or
+# vertices; a worker reads whatever neighbours its range needs straight from
+# the shared arrays, so ranges need no halo copies, and every value is
+# written by exactly one task, so nothing needs stitching afterwards.
+#
+# The topology is built in parallel too and comes out exactly as Refinement
+# builds it, edge numbering included, so the result is identical to the
+# serial numpy engine:
+#   - grouping by vertex is a stable bucket sort: every quad range counts its
+#     keys per bucket of the key range, and every bucket is then sorted on
+#     its own
+#   - every half edge finds the other half edge of its edge among the half
+#     edges around its two end vertices
+#   - an edge is numbered by its first half edge, with offsets from a prefix
+#     count over the half edge ranges, as in order of first appearance
+
+# The refinement arrays the geometry steps read
+_TOPOLOGY = ['quads', 'halfEdges', 'edges', 'edgeQuads', 'vertexQuads', 'vertexQuadStart',
+             'vertexEdges', 'vertexEdgeStart', 'valence']
+
+# Where the shared arrays go
+_SCRATCH = '/dev/shm' if os.path.isdir('/dev/shm') else None
+
+
+# Split range(count) into about the given number of (lo, hi) chunks
+def _chunks(count, chunkCount):
+    bounds = np.linspace(0, count, chunkCount + 1).astype(np.int64)
+    return [(int(lo), int(hi)) for lo, hi in zip(bounds[:-1], bounds[1:]) if lo < hi]
+
+
+# Open a shared array by name in the given directory
+def _open(directory, name):
+    return np.load(os.path.join(directory, name + '.npy'), mmap_mode='r+')
+
+
+# Return the end vertex of the given half edges, from the flattened quads
+def _heEnds(flatQuads, he):
+    return flatQuads[he - he % 4 + (he + 1) % 4]
+
+
+# Count the keys[lo:hi] falling into every bucket of the key range
+def _bucketCount(load, lo, hi, keys, bounds):
+    k = load(keys).reshape(-1)[lo:hi]
+    return np.bincount(np.searchsorted(bounds[1:-1], k, side='right'), minlength=len(bounds) - 1)
+
+
+# File the indices lo..hi-1 under the buckets of their keys, starting at the
+# given per-bucket offsets
+def _bucketScatter(load, lo, hi, keys, bounds, offsets, scratch):
+    bucket = np.searchsorted(bounds[1:-1], load(keys).reshape(-1)[lo:hi], side='right')
+    order = np.argsort(bucket, kind='mergesort')
+    bucket = bucket[order]
+    sizes = np.bincount(bucket, minlength=len(offsets))
+    rank = np.arange(len(bucket)) - (np.cumsum(sizes) - sizes)[bucket]
+    load(scratch)[offsets[bucket] + rank] = lo + order
+
+
+# Sort the indices in slots lo..hi of scratch, all of one bucket holding the
+# keys keyLo..keyHi-1, into groupBy order. The group offsets are written to
+# start, the group sizes to counts if given. Returns the largest group size
+def _bucketSort(load, lo, hi, keys, keyLo, keyHi, scratch, order, start, divisor, counts):
+    indices = np.array(load(scratch)[lo:hi])
+    local = load(keys).reshape(-1)[indices]
+    load(order)[lo:hi] = indices[np.argsort(local, kind='mergesort')] // divisor
+
+    sizes = np.bincount(local - keyLo, minlength=keyHi - keyLo)
+    load(start)[keyLo + 1:keyHi + 1] = lo + np.cumsum(sizes)
+    if counts is not None:
+        load(counts)[keyLo:keyHi] = sizes
+    return int(sizes.max()) if len(sizes) else 0
+
+
+# Write the end vertex of the half edges in slots lo..hi-1 of the grouping
+# by vertex
+def _groupedEnds(load, lo, hi):
+    load('groupedEnds')[lo:hi] = _heEnds(load('quads').reshape(-1), load('heOrder')[lo:hi])
+
+
+# Find the other half edge of every half edge lo..hi-1 among the half edges
+# leaving its two end vertices. Returns how many of them come first on their
+# edge
+def _twins(load, lo, hi, maxValence):
+    flat = load('quads').reshape(-1)
+    heOrder = load('heOrder')
+    groupedEnds = load('groupedEnds')
+    start = load('vertexQuadStart')
+
+    he = np.arange(lo, hi)
+    a = np.asarray(flat[lo:hi])
+    b = _heEnds(flat, he)
+
+    twin = np.full(hi - lo, -1, dtype=np.int64)
+    found = np.zeros(hi - lo, dtype=np.int64)
+
+    # The other half edge runs from b to a. Where the mesh is not consistently
+    # oriented it runs from a to b again instead; those are only looked for
+    # where nothing ran back. A third half edge on an edge always leaves some
+    # half edge of it with a count other than one
+    search = np.arange(hi - lo)
+    for origin, target in ((b, a), (a, b)):
+        first = start[origin[search]]
+        size = start[origin[search] + 1] - first
+        target = target[search]
+        for k in range(maxValence):
+            active = np.nonzero(k < size)[0]
+            slot = first[active] + k
+            match = np.nonzero(groupedEnds[slot] == target[active])[0]
+
+            candidate = heOrder[slot[match]]
+            hit = search[active[match]]
+            keep = candidate != he[hit]
+            twin[hit[keep]] = candidate[keep]
+            found[hit[keep]] += 1
+
+        search = np.nonzero(found == 0)[0]
+        if len(search) == 0:
+            break
+
+    if np.any(found != 1):
+        raise ValueError("mesh is not closed: every edge must border exactly two quads")
+
+    load('twins')[lo:hi] = twin
+    load('vertexQuads')[lo:hi] = heOrder[lo:hi] // 4
+    return int((twin > he).sum())
+
+
+# Number the edges whose first half edge is among lo..hi-1, from offset on
+def _numberEdges(load, lo, hi, offset):
+    flat = load('quads').reshape(-1)
+    twin = np.asarray(load('twins')[lo:hi])
+    he = np.arange(lo, hi)
+    first = np.nonzero(twin > he)[0]
+    ids = offset + np.arange(len(first))
+
+    load('halfEdges').reshape(-1)[lo + first] = ids
+    a = np.asarray(flat[lo:hi])[first]
+    b = _heEnds(flat, he[first])
+    edges = load('edges')
+    edges[ids, 0] = np.minimum(a, b)
+    edges[ids, 1] = np.maximum(a, b)
+    edgeQuads = load('edgeQuads')
+    edgeQuads[ids, 0] = he[first] // 4
+    edgeQuads[ids, 1] = twin[first] // 4
+
+
+# Give the second half edge of every edge among lo..hi-1 its edge number
+def _shareEdges(load, lo, hi):
+    halfEdges = load('halfEdges').reshape(-1)
+    twin = np.asarray(load('twins')[lo:hi])
+    second = np.nonzero(twin < np.arange(lo, hi))[0]
+    halfEdges[lo + second] = halfEdges[twin[second]]
+
+
+# A Refinement reading its topology from the shared arrays
+def _refinement(load, vertexCount):
+    refinement = Refinement.__new__(Refinement)
+    for name in _TOPOLOGY:
+        setattr(refinement, name, load(name))
+    refinement.vertexCount = vertexCount
+    refinement.edgeCount = len(refinement.edges)
+    return refinement
+
+
+# Compute one range of face, edge or vertex points, or of refined quads,
+# straight into the output
+def _geometry(load, lo, hi, part, vertexCount, technique):
+    refinement = _refinement(load, vertexCount)
+    verts = load('verts')
+    out = load('out')
+
+    faceStart = vertexCount
+    edgeStart = vertexCount + len(refinement.quads)
+    facePts = out[faceStart:edgeStart]
+    edgePts = out[edgeStart:]
+
+    if part == 'face':
+        facePts[lo:hi] = refinement.facePoints(verts, lo, hi)
+    elif part == 'edge':
+        edgePts[lo:hi] = refinement.edgePoints(verts, facePts, lo, hi)
+    elif part == 'vertex':
+        out[lo:hi] = refinement.vertexPoints(verts, facePts, edgePts, technique, lo, hi)
+    else:
+        load('newQuads')[4 * lo:4 * hi] = refinement.refinedQuads(lo, hi)
+
+
+_STEPS = {
+    'bucketCount': _bucketCount,
+    'bucketScatter': _bucketScatter,
+    'bucketSort': _bucketSort,
+    'groupedEnds': _groupedEnds,
+    'twins': _twins,
+    'numberEdges': _numberEdges,
+    'shareEdges': _shareEdges,
+    'geometry': _geometry,
+}
+
+
+def _runTask(task):
+    step, directory, lo, hi, args = task
+    return _STEPS[step](lambda name: _open(directory, name), lo, hi, **args)
+
+
+# A pool of worker processes that refines meshes one level at a time (see
+# above). The pool and its scratch directory are kept until close, so
+# several levels and meshes pay for starting the workers once
+class ParallelEngine(object):
+
+    def __init__(self, workers=None):
+        self.workers = workers or multiprocessing.cpu_count()
+        self.directory = tempfile.mkdtemp(prefix='subdiv-', dir=_SCRATCH)
+        self._pool = multiprocessing.Pool(self.workers)
+
+        # Several chunks per worker keep the pool busy when ranges differ in cost
+        self.chunkCount = self.workers * 4
+
+    # Stop the workers and remove the shared arrays
+    def close(self):
+        if self._pool is not None:
+            self._pool.close()
+            self._pool.join()
+            self._pool = None
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    # Refine an (N, 3) vertex array and (F, 4) quads the given number of
+    # levels. Returns the refined vertices and quads. profile, if given,
+    # records the steps (see profiling.SubdivisionProfile)
+    def subdivide(self, quads, verts, levels=1, technique=2, profile=NULL_PROFILE):
+        verts = np.asarray(verts, dtype=np.float64)
+        quads = np.asarray(quads, dtype=np.int64).reshape(-1, 4)
+        self._create('verts', verts.shape, np.float64)[...] = verts
+        self._create('quads', quads.shape, np.int64)[...] = quads
+
+        vertexCount, faceCount = len(verts), len(quads)
+        try:
+            for level in range(levels):
+                vertexCount = self._level(vertexCount, faceCount, technique, profile)
+                faceCount *= 4
+                self._replace('out', 'verts')
+                self._replace('newQuads', 'quads')
+
+            return np.array(self._load('verts')), np.array(self._load('quads'))
+        finally:
+            for name in os.listdir(self.directory):
+                os.remove(os.path.join(self.directory, name))
+
+    # Refine the shared verts and quads one level into out and newQuads.
+    # Returns the refined vertex count
+    def _level(self, vertexCount, faceCount, technique, profile):
+        halfEdgeCount = 4 * faceCount
+
+        # Group the half edges by the vertex they leave
+        self._create('heOrder', (halfEdgeCount,), np.int64)
+        self._create('vertexQuads', (halfEdgeCount,), np.int64)
+        self._create('vertexQuadStart', (vertexCount + 1,), np.int64)[0] = 0
+        self._create('valence', (vertexCount,), np.int64)
+        maxValence = self._groupBy('quads', halfEdgeCount, vertexCount, 'heOrder', 'vertexQuadStart',
+                                   counts='valence')
+
+        # Pair the half edges up and number the edges
+        self._create('groupedEnds', (halfEdgeCount,), np.int64)
+        self._create('twins', (halfEdgeCount,), np.int64)
+        self._create('halfEdges', (faceCount, 4), np.int64)
+        ranges = _chunks(halfEdgeCount, self.chunkCount)
+        self._map('groupedEnds', ranges)
+        firsts = self._map('twins', ranges, maxValence=maxValence)
+        offsets = np.concatenate([[0], np.cumsum(firsts)])
+        edgeCount = int(offsets[-1])
+        if 2 * edgeCount != halfEdgeCount:
+            raise ValueError("mesh is not closed: every edge must border exactly two quads")
+
+        self._create('edges', (edgeCount, 2), np.int64)
+        self._create('edgeQuads', (edgeCount, 2), np.int64)
+        self._map('numberEdges', ranges, offset=[int(offset) for offset in offsets[:-1]])
+        self._map('shareEdges', ranges)
+
+        # Group the edges by their end vertices
+        self._create('vertexEdges', (2 * edgeCount,), np.int64)
+        self._create('vertexEdgeStart', (vertexCount + 1,), np.int64)[0] = 0
+        self._groupBy('edges', 2 * edgeCount, vertexCount, 'vertexEdges', 'vertexEdgeStart', divisor=2)
+        profile.phase('topology', edgeCount)
+
+        # The geometry steps must run in order, each one reads the points of the last
+        self._create('out', (vertexCount + faceCount + edgeCount, 3), np.float64)
+        self._create('newQuads', (4 * faceCount, 4), np.int64)
+        for part, count, elements in (('face', faceCount, 'face points'),
+                                      ('edge', edgeCount, 'edge points'),
+                                      ('vertex', vertexCount, 'vertex points'),
+                                      ('quads', faceCount, 'new quads')):
+            self._map('geometry', _chunks(count, self.chunkCount), part=part,
+                      vertexCount=vertexCount, technique=technique)
+            profile.phase(elements, 4 * faceCount if part == 'quads' else count)
+
+        return vertexCount + faceCount + edgeCount
+
+    # Stable parallel groupBy of the count keys in the keys array, each below
+    # keyCount. Writes the grouped indices (divided by divisor) to order and
+    # the group offsets to start, and the group sizes to counts if given.
+    # Returns the largest group size
+    def _groupBy(self, keys, count, keyCount, order, start, divisor=1, counts=None):
+        ranges = _chunks(count, self.chunkCount)
+        bounds = np.linspace(0, keyCount, self.chunkCount + 1).astype(np.int64)
+
+        perRange = np.array(self._map('bucketCount', ranges, keys=keys, bounds=bounds))
+        bucketStart = np.concatenate([[0], np.cumsum(perRange.sum(axis=0))])
+        offsets = bucketStart[:-1] + np.cumsum(perRange, axis=0) - perRange
+
+        self._create('scatter', (count,), np.int64)
+        self._map('bucketScatter', ranges, keys=keys, bounds=bounds, offsets=list(offsets), scratch='scatter')
+
+        buckets = [(int(bucketStart[b]), int(bucketStart[b + 1])) for b in range(len(bounds) - 1)]
+        sizes = self._map('bucketSort', buckets, keys=keys, keyLo=[int(k) for k in bounds[:-1]],
+                          keyHi=[int(k) for k in bounds[1:]], scratch='scatter', order=order,
+                          start=start, divisor=divisor, counts=counts)
+        return max(sizes)
+
+    # Run a step over the given (lo, hi) ranges. List arguments give one
+    # value per range
+    def _map(self, step, ranges, **args):
+        perRange = dict((name, value) for name, value in args.items() if isinstance(value, list))
+        tasks = []
+        for i, (lo, hi) in enumerate(ranges):
+            taskArgs = dict(args)
+            for name, values in perRange.items():
+                taskArgs[name] = values[i]
+            tasks.append((step, self.directory, lo, hi, taskArgs))
+        return self._pool.map(_runTask, tasks)
+
+    def _path(self, name):
+        return os.path.join(self.directory, name + '.npy')
+
+    def _create(self, name, shape, dtype):
+        return np.lib.format.open_memmap(self._path(name), mode='w+', dtype=dtype, shape=shape)
+
+    def _load(self, name):
+        return _open(self.directory, name)
+
+    # Move a shared array over another
+    def _replace(self, source, target):
+        replaceFile(self._path(source), self._path(target))
+
+
+# Engines kept for later calls, by worker count
+_engines = {}
+
+
+@atexit.register
+def _closeEngines():
+    for engine in _engines.values():
+        engine.close()
+    _engines.clear()
+
+
+# Refine an (N, 3) vertex array the given number of levels over a pool of
+# worker processes. The pool of the given size is started on first use and
+# kept for later calls. Returns the refined vertices and quads, identical to
+# the serial numpy engine's. profile, if given, records the steps (see
+# profiling.SubdivisionProfile)
+def subdivideParallel(quads, verts, workers=None, technique=2, profile=NULL_PROFILE, levels=1):
+    workers = workers or multiprocessing.cpu_count()
+    engine = _engines.get(workers)
+    if engine is None:
+        engine = _engines[workers] = ParallelEngine(workers)
+    return engine.subdivide(quads, verts, levels, technique, profile)
@@ -0,0 +1,160 @@
+##############################################################################
+# This software is licensed under a modified MIT license. The MIT license itself
+# is unchanged, we have only added an optional beerware clause (based off of
+# Poul-Henning Kamp's Beerware license). That is to say, you have the option
+# of completely disregarding the beerware clause and using this software under
+# the vanilla MIT license if you so wish.
+#
+# Copyright (c) 2013 Chris Gibson
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
+# Optional beerware clause:
+# If we happen to meet in person someday and you think this software is worth
+# it, you are welcome to buy us a round of beers. This clause is entirely
+# optional, and need not be fulfilled for you to fully comply with the terms
+# of this license.
+##############################################################################
+
+import sys
+import time
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+
+# Per-phase instrumentation of SubdMesh.subdivide.
+#
+# Pass an instance as subdivide(profile=...). Every subdivided level is
+# recorded as a dict:
+#
+#   {'engine': ..., 'vertices': ..., 'quads': ..., 'seconds': ...,
+#    'phases': [{'phase': ..., 'seconds': ..., 'elements': ...,
+#                'netBlocks': ..., 'netBytes': ..., 'peakBytes': ...}, ...]}
+#
+# vertices and quads are the counts going into the level, and elements is the
+# number of points or quads a phase produced.
+#
+# The memory figures are not allocation counts: Python has no cheap way to
+# count allocations as they happen. netBlocks is the net change in
+# interpreter memory blocks over the phase (None where the interpreter can't
+# tell) and netBytes the net change in memory traced by tracemalloc, so
+# temporaries freed within the phase cancel out of both. peakBytes is how far
+# traced memory rose above its level at the start of the phase, which is
+# where the temporaries show. Both traced figures are None unless
+# tracemalloc is tracing, and peakBytes also needs tracemalloc.reset_peak
+# (Python 3.9).
+#
+# Levels are kept in self.levels and handed to callback, if given, as soon as
+# they finish, ready to be forwarded elsewhere.
+class SubdivisionProfile(object):
+
+    def __init__(self, callback=None):
+        self.callback = callback
+        self.levels = []
+        self._level = None
+
+    def beginLevel(self, engine, vertexCount, quadCount):
+        self._level = {
+            'engine': engine,
+            'vertices': vertexCount,
+            'quads': quadCount,
+            'phases': [],
+        }
+        self._levelStart = time.time()
+        self._mark = self._counters()
+
+    # Close the current phase, which produced the given number of elements
+    def phase(self, name, elements):
+        peak = self._peak()
+        now = self._counters()
+        seconds, blocks, traced = [_delta(a, b) for a, b in zip(self._mark, now)]
+        self._level['phases'].append({
+            'phase': name,
+            'seconds': seconds,
+            'elements': elements,
+            'netBlocks': blocks,
+            'netBytes': traced,
+            'peakBytes': peak,
+        })
+        self._mark = now
+
+    def endLevel(self):
+        level = self._level
+        level['seconds'] = time.time() - self._levelStart
+        self.levels.append(level)
+        self._level = None
+
+        if self.callback is not None:
+            self.callback(level)
+
+    # Return the total seconds spent in each phase over all levels
+    def totals(self):
+        totals = {}
+        for level in self.levels:
+            for phase in level['phases']:
+                totals[phase['phase']] = totals.get(phase['phase'], 0.0) + phase['seconds']
+        return totals
+
+    # Return (time, interpreter blocks, traced bytes), starting the peak of
+    # traced memory over from here
+    def _counters(self):
+        blocks = sys.getallocatedblocks() if hasattr(sys, 'getallocatedblocks') else None
+        traced = None
+        if _tracingPeaks():
+            tracemalloc.reset_peak()
+        if tracemalloc is not None and tracemalloc.is_tracing():
+            traced = tracemalloc.get_traced_memory()[0]
+        return time.time(), blocks, traced
+
+    # Return the peak traced bytes since the last mark, above the traced bytes
+    # at the mark
+    def _peak(self):
+        if not _tracingPeaks() or self._mark[2] is None:
+            return None
+        return tracemalloc.get_traced_memory()[1] - self._mark[2]
+
+
+def _tracingPeaks():
+    return tracemalloc is not None and tracemalloc.is_tracing() and hasattr(tracemalloc, 'reset_peak')
+
+
+def _delta(before, after):
+    if before is None or after is None:
+        return None
+    return after - before
+
+
+# Stands in for a profile when subdivide is not profiled, so the phase hooks
+# cost one empty call each
+class _NullProfile(object):
+
+    def beginLevel(self, engine, vertexCount, quadCount):
+        pass
+
+    def phase(self, name, elements):
+        pass
+
+    def endLevel(self):
+        pass
+
+
+NULL_PROFILE = _NullProfile()
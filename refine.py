@@ -0,0 +1,227 @@
+##############################################################################
+# This software is licensed under a modified MIT license. The MIT license itself
+# is unchanged, we have only added an optional beerware clause (based off of
+# Poul-Henning Kamp's Beerware license). That is to say, you have the option
+# of completely disregarding the beerware clause and using this software under
+# the vanilla MIT license if you so wish.
+#
+# Copyright (c) 2013 Chris Gibson
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
+# Optional beerware clause:
+# If we happen to meet in person someday and you think this software is worth
+# it, you are welcome to buy us a round of beers. This clause is entirely
+# optional, and need not be fulfilled for you to fully comply with the terms
+# of this license.
+##############################################################################
+
+import numpy as np
+
+
+# Vertex weights for STEP THREE of catmull-clark subdivision, keyed by technique.
+# There are many methods of weighing the various elements; each one maps the
+# number of faces n around a vertex (a float or an array of floats) to the
+# weights (w1, w2, w3) of the old position, the average face point and the
+# average edge point.
+WEIGHTS = {
+    # Technique 1
+    1: lambda n: ((n - 3.0) / n,
+                  1.0 / n,
+                  2.0 / n),
+
+    # Technique 2
+    2: lambda n: ((n - 2.5) / n,
+                  1.0 / n,
+                  1.5 / n),
+
+    # Technique 3
+    3: lambda n: (((4.0 * n) - 7.0) / (4.0 * n),
+                  1.0 / (4.0 * (n * n)),
+                  1.0 / (2.0 * (n * n))),
+
+    # Technique 4: the original catmull-clark rule (F + 2R + (n-3)P) / n, with
+    # the average edge midpoint R written in terms of the edge points
+    4: lambda n: ((n - 3.0) / n,
+                  -1.0 / n,
+                  4.0 / n),
+}
+
+
+# Group the indices 0..len(keys)-1 by key. Returns the indices sorted by key
+# and an array of count+1 offsets, such that the indices with key k are
+# order[start[k]:start[k+1]]
+def groupBy(keys, count):
+    order = np.argsort(keys, kind='mergesort')
+    start = np.zeros(count + 1, dtype=np.int64)
+    np.cumsum(np.bincount(keys, minlength=count), out=start[1:])
+    return order, start
+
+
+# Sum the rows of values over the segments given by a groupBy offset array
+def segmentSum(values, start):
+    out = np.zeros((len(start) - 1,) + values.shape[1:], dtype=values.dtype)
+    nonEmpty = start[:-1] < start[1:]
+    if np.any(nonEmpty):
+        out[nonEmpty] = np.add.reduceat(values, start[:-1][nonEmpty], axis=0)
+    return out
+
+
+# The topology of a single catmull-clark step over a closed quad mesh.
+#
+# Everything here depends only on the quad indices, so one Refinement can be
+# applied to any number of vertex arrays sharing that topology. Vertex arrays
+# are (N, C) with C = 3 for a single mesh; any extra columns are simply carried
+# along, which lets several meshes be refined in the same pass.
+#
+# The refined vertices are laid out the same way SubdMesh.subdivide adds them:
+# the N repositioned old vertices, then one face point per quad, then one edge
+# point per edge in the order the quad loop first meets the edges.
+class Refinement(object):
+
+    def __init__(self, quads, vertexCount):
+        self.quads = np.asarray(quads, dtype=np.int64).reshape(-1, 4)
+        self.vertexCount = vertexCount
+        faceCount = len(self.quads)
+
+        # Every quad corner starts a half edge running to the next corner
+        heStart = self.quads.ravel()
+        heEnd = np.roll(self.quads, -1, axis=1).ravel()
+        lo = np.minimum(heStart, heEnd)
+        hi = np.maximum(heStart, heEnd)
+
+        # Find the unique edges, and number them in order of first appearance
+        keys = lo * vertexCount + hi
+        _, first, inverse, counts = np.unique(keys, return_index=True,
+                                              return_inverse=True,
+                                              return_counts=True)
+        if np.any(counts != 2):
+            raise ValueError("mesh is not closed: every edge must border exactly two quads")
+
+        order = np.argsort(first, kind='mergesort')
+        rank = np.empty_like(order)
+        rank[order] = np.arange(len(order))
+
+        # The edge every half edge lies on, and the (lo, hi) vertices of each edge
+        self.halfEdges = rank[inverse.ravel()].reshape(faceCount, 4)
+        self.edges = np.column_stack([lo[first[order]], hi[first[order]]])
+        self.edgeCount = len(self.edges)
+
+        # The two quads every edge straddles
+        byEdge, _ = groupBy(self.halfEdges.ravel(), self.edgeCount)
+        self.edgeQuads = (byEdge // 4).reshape(-1, 2)
+
+        # The quads and edges around every vertex
+        byVertex, self.vertexQuadStart = groupBy(heStart, vertexCount)
+        self.vertexQuads = byVertex // 4
+
+        byVertex, self.vertexEdgeStart = groupBy(self.edges.ravel(), vertexCount)
+        self.vertexEdges = byVertex // 2
+
+        # The number of quads around every vertex
+        self.valence = np.diff(self.vertexQuadStart)
+
+    # The number of vertices after refinement
+    def refinedVertexCount(self):
+        return self.vertexCount + len(self.quads) + self.edgeCount
+
+    # STEP ONE: the center of every quad. lo and hi pick a range of quads
+    def facePoints(self, verts, lo=0, hi=None):
+        return verts[self.quads[lo:hi]].mean(axis=1)
+
+    # STEP TWO: the average of each edge's end points and the face points of the
+    # two quads it straddles. lo and hi pick a range of edges
+    def edgePoints(self, verts, facePts, lo=0, hi=None):
+        edges = self.edges[lo:hi]
+        edgeQuads = self.edgeQuads[lo:hi]
+        return (verts[edges[:, 0]] + verts[edges[:, 1]] +
+                facePts[edgeQuads[:, 0]] + facePts[edgeQuads[:, 1]]) / 4.0
+
+    # STEP THREE: move the old vertices. Vertices no quad uses are left alone.
+    # lo and hi pick a range of vertices
+    def vertexPoints(self, verts, facePts, edgePts, technique=2, lo=0, hi=None):
+        if hi is None:
+            hi = self.vertexCount
+
+        faceStart = self.vertexQuadStart[lo:hi+1]
+        faceSum = segmentSum(facePts[self.vertexQuads[faceStart[0]:faceStart[-1]]],
+                             faceStart - faceStart[0])
+
+        edgeStart = self.vertexEdgeStart[lo:hi+1]
+        edgeSum = segmentSum(edgePts[self.vertexEdges[edgeStart[0]:edgeStart[-1]]],
+                             edgeStart - edgeStart[0])
+
+        valence = self.valence[lo:hi]
+        used = valence > 0
+        n = valence[used].astype(np.float64)[:, None]
+        edgeCount = np.diff(edgeStart)[used][:, None]
+
+        w1, w2, w3 = WEIGHTS[technique](n)
+
+        out = np.array(verts[lo:hi], dtype=np.float64)
+        out[used] = (w1 * out[used] +
+                     w2 * (faceSum[used] / n) +
+                     w3 * (edgeSum[used] / edgeCount))
+        return out
+
+    # STEP FOUR: the four quads every old quad is split into. Each one is
+    # (face point, previous edge point, old corner, next edge point). lo and
+    # hi pick a range of old quads
+    def refinedQuads(self, lo=0, hi=None):
+        faceCount = len(self.quads)
+        if hi is None:
+            hi = faceCount
+        facePtIdx = self.vertexCount + np.arange(lo, hi)
+        edgePtIdx = self.vertexCount + faceCount + np.asarray(self.halfEdges[lo:hi])
+
+        newQuads = np.empty((hi - lo, 4, 4), dtype=np.int64)
+        newQuads[:, :, 0] = facePtIdx[:, None]
+        newQuads[:, :, 1] = np.roll(edgePtIdx, 1, axis=1)
+        newQuads[:, :, 2] = self.quads[lo:hi]
+        newQuads[:, :, 3] = edgePtIdx
+        return newQuads.reshape(-1, 4)
+
+    # Refine an (N, C) vertex array, returning the (N + F + E, C) refined array
+    def apply(self, verts, technique=2):
+        verts = np.asarray(verts, dtype=np.float64)
+        facePts = self.facePoints(verts)
+        edgePts = self.edgePoints(verts, facePts)
+        vertPts = self.vertexPoints(verts, facePts, edgePts, technique)
+        return np.concatenate([vertPts, facePts, edgePts])
+
+
+# Subdivide K meshes that share one quad topology. positions is a (K, N, 3)
+# array of vertex positions, one set per pose. The topology of every level is
+# worked out once and all poses are refined together as (N, K * 3) columns.
+# Returns the (K, N', 3) refined positions and the (F', 4) refined quads
+def subdivideBatch(quads, positions, levels=1, technique=2):
+    positions = np.asarray(positions, dtype=np.float64)
+    if positions.ndim != 3 or positions.shape[2] != 3:
+        raise ValueError("positions must be a (K, N, 3) array, got %s" % (positions.shape,))
+
+    poseCount, vertexCount = positions.shape[:2]
+    quads = np.asarray(quads, dtype=np.int64).reshape(-1, 4)
+
+    verts = positions.transpose(1, 0, 2).reshape(vertexCount, poseCount * 3)
+    for level in range(levels):
+        refinement = Refinement(quads, len(verts))
+        verts = refinement.apply(verts, technique)
+        quads = refinement.refinedQuads()
+
+    return verts.reshape(len(verts), poseCount, 3).transpose(1, 0, 2), quads
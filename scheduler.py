@@ -0,0 +1,91 @@
+##############################################################################
+# This software is licensed under a modified MIT license. The MIT license itself
+# is unchanged, we have only added an optional beerware clause (based off of
+# Poul-Henning Kamp's Beerware license). That is to say, you have the option
+# of completely disregarding the beerware clause and using this software under
+# the vanilla MIT license if you so wish.
+#
+# Copyright (c) 2013 Chris Gibson
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
+# Optional beerware clause:
+# If we happen to meet in person someday and you think this software is worth
+# it, you are welcome to buy us a round of beers. This clause is entirely
+# optional, and need not be fulfilled for you to fully comply with the terms
+# of this license.
+##############################################################################
+
+# Deciding when the viewer draws a frame.
+#
+# Instead of redrawing as fast as possible, the render loop asks a
+# RenderScheduler to wait for the next frame. While something moves (the
+# animation is on, or a level is being built or uploaded) frames come at a
+# fixed target rate and the time in between is slept away. Otherwise the
+# scheduler blocks in the window system until an input event asks for a
+# redraw, and an idle viewer uses no CPU.
+#
+# The window system calls are passed in, so this module does not depend on
+# glfw: waitEvents blocks until an event has been handled, pollEvents handles
+# the waiting events and returns, and clock and sleep work in seconds.
+
+import time
+
+
+class RenderScheduler(object):
+
+    def __init__(self, waitEvents, pollEvents, rate=60.0, clock=time.time, sleep=time.sleep):
+        if rate <= 0:
+            raise ValueError("frame rate must be positive, got %s" % rate)
+
+        self.interval = 1.0 / rate
+        self.animating = True
+        self._waitEvents = waitEvents
+        self._pollEvents = pollEvents
+        self._clock = clock
+        self._sleep = sleep
+        self._nextTick = clock()
+        self._dirty = True
+
+    # Ask for a frame to be drawn, from an event callback for instance
+    def invalidate(self):
+        self._dirty = True
+
+    # Return when the next frame should be drawn, handling window events in
+    # the meantime. busy says background work is in progress that has to be
+    # checked every tick even with the animation off
+    def waitForFrame(self, busy=False):
+        if self.animating or busy:
+            self._sleepUntilTick()
+            self._pollEvents()
+        else:
+            # Nothing moves by itself: sleep until an event calls invalidate
+            while not self._dirty:
+                self._waitEvents()
+            self._nextTick = self._clock()
+        self._dirty = False
+
+    def _sleepUntilTick(self):
+        now = self._clock()
+        if now < self._nextTick:
+            self._sleep(self._nextTick - now)
+            now = self._clock()
+
+        # Frames that were missed are dropped instead of drawn in a burst
+        self._nextTick = max(self._nextTick, now) + self.interval
@@ -1,8 +1,16 @@
 #version 150
 
+uniform vec4 wireColor;
+
 in vec4 fs_color;
+in vec3 fs_edge;
 out vec4 fragcolor;
 
 void main() {
-  fragcolor = fs_color;
+  // Distance to the nearest face edge in pixels, from the interpolated edge
+  // coordinates. Blend to the wire color within about a pixel of an edge
+  // A quad's ez is constant, so its fwidth is zero
+  vec3 pixels = fs_edge / max(fwidth(fs_edge), 1e-6);
+  float wire = 1.0 - smoothstep(0.5, 1.5, min(pixels.x, min(pixels.y, pixels.z)));
+  fragcolor = mix(fs_color, wireColor, wire);
 }
\ No newline at end of file
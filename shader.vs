@@ -3,10 +3,33 @@
 uniform mat4 mvp;
 uniform vec4 color;
 
+// When set, every instance is moved by its own vs_model matrix and drawn in
+// its own vs_color, both read from a per-instance buffer
+uniform bool instanced;
+
 in vec4 vs_position;
+in vec3 vs_normal;
+in vec3 vs_edge;
+in mat4 vs_model;
+in vec4 vs_color;
 out vec4 fs_color;
+out vec3 fs_edge;
+
+// Fixed light direction, in model space
+const vec3 light = vec3(0.4, 0.8, 0.6);
 
 void main() {
-  fs_color = color;
-  gl_Position = mvp * vs_position;
+  vec4 position = vs_position;
+  vec3 normal = vs_normal;
+  vec4 baseColor = color;
+  if (instanced) {
+    position = vs_model * vs_position;
+    normal = mat3(vs_model) * vs_normal;
+    baseColor = vs_color;
+  }
+
+  float diffuse = max(dot(normalize(normal), normalize(light)), 0.0);
+  fs_color = vec4(baseColor.rgb * (0.3 + 0.7 * diffuse), baseColor.a);
+  fs_edge = vs_edge;
+  gl_Position = mvp * position;
 }
\ No newline at end of file
@@ -31,40 +31,137 @@
 #  For more information, please refer to <http://unlicense.org/>
 #
 ##############################################################################
+import ctypes
+import hashlib
+import os
+import struct
+
 from OpenGL.GL import *
+from OpenGL.error import GLError
 
-def loadShader(filename, shadertype):
+from fileutil import atomicWrite
+
+def compileShader(source, shadertype):
     '''
-    Creates, loads and compiles a shader by filename.
+    Creates and compiles a shader from its source.
     '''
     shader = None
     try:
-        with open(filename) as f:
-            shader = glCreateShader(shadertype)
-            glShaderSource(shader, f.readlines())
-            glCompileShader(shader)
-            if glGetShaderiv(shader, GL_COMPILE_STATUS) != GL_TRUE:
-                info = glGetShaderInfoLog(shader)
-                raise Exception, "Unable to compile shader. Infolog:\n%s" % (info,)
-            return shader
+        shader = glCreateShader(shadertype)
+        glShaderSource(shader, source)
+        glCompileShader(shader)
+        if glGetShaderiv(shader, GL_COMPILE_STATUS) != GL_TRUE:
+            info = glGetShaderInfoLog(shader)
+            raise Exception, "Unable to compile shader. Infolog:\n%s" % (info,)
+        return shader
     except Exception as e:
         if shader != None:
             glDeleteShader(shader)
         raise
 
-def createProgram(fnvert, fnfrag):
+def loadShader(filename, shadertype):
+    '''
+    Creates, loads and compiles a shader by filename.
+    '''
+    with open(filename) as f:
+        return compileShader(f.readlines(), shadertype)
+
+def supportsProgramBinaries():
+    '''
+    Tells whether the driver can hand out and take back linked programs.
+    '''
+    return bool(glGetProgramBinary) and bool(glProgramBinary) \
+        and glGetIntegerv(GL_NUM_PROGRAM_BINARY_FORMATS) > 0
+
+def programCacheKey(*sources):
+    '''
+    Returns the cache key of a program linked from the given shader sources
+    on the current driver. Binaries only load on the driver that made them,
+    so its vendor, renderer and version strings are part of the key.
+    '''
+    digest = hashlib.sha1()
+    for part in [glGetString(GL_VENDOR), glGetString(GL_RENDERER), glGetString(GL_VERSION)] + list(sources):
+        digest.update(struct.pack('<Q', len(part)))
+        digest.update(part)
+    return digest.hexdigest()
+
+def loadProgramBinary(filename):
+    '''
+    Creates a program from a binary saved by saveProgramBinary. Returns None
+    if the file is missing or the driver rejects the binary.
+    '''
+    if not os.path.exists(filename):
+        return None
+    with open(filename, 'rb') as f:
+        data = f.read()
+    if len(data) < 4:
+        return None
+
+    binaryformat = struct.unpack('<I', data[:4])[0]
+    prog = glCreateProgram()
+    try:
+        glProgramBinary(prog, binaryformat, data[4:], len(data) - 4)
+    except GLError:
+        # The format is not one the driver takes (any more)
+        glDeleteProgram(prog)
+        return None
+    if glGetProgramiv(prog, GL_LINK_STATUS) != GL_TRUE:
+        glDeleteProgram(prog)
+        return None
+    return prog
+
+def saveProgramBinary(prog, filename):
+    '''
+    Writes the binary of a linked program to a file, prefixed with its format.
+    '''
+    size = glGetProgramiv(prog, GL_PROGRAM_BINARY_LENGTH)
+    if size <= 0:
+        return
+    length = ctypes.c_int(0)
+    binaryformat = ctypes.c_uint(0)
+    binary = ctypes.create_string_buffer(int(size))
+    glGetProgramBinary(prog, size, ctypes.byref(length), ctypes.byref(binaryformat), binary)
+
+    directory = os.path.dirname(filename)
+    if directory and not os.path.isdir(directory):
+        os.makedirs(directory)
+
+    # Another run never reads half a file
+    with atomicWrite(filename) as f:
+        f.write(struct.pack('<I', binaryformat.value))
+        f.write(binary.raw[:length.value])
+
+def createProgram(fnvert, fnfrag, cachedir=None):
     '''
     Creates, loads, compiles and links a program using two shaderfiles.
+
+    If cachedir is given, the linked program binary is kept there and loaded
+    instead of compiling on later runs, as long as the sources and the driver
+    stay the same. A binary the driver rejects is compiled again and replaced.
     '''
+    with open(fnvert, 'rb') as f:
+        vertsource = f.read()
+    with open(fnfrag, 'rb') as f:
+        fragsource = f.read()
+
+    cachefile = None
+    if cachedir is not None and supportsProgramBinaries():
+        cachefile = os.path.join(cachedir, programCacheKey(vertsource, fragsource) + ".bin")
+        prog = loadProgramBinary(cachefile)
+        if prog is not None:
+            return prog
+
     prog = None
     vertsh = None
     fragsh = None
     try:
         prog = glCreateProgram()
     
-        vertsh = loadShader(fnvert, GL_VERTEX_SHADER)
-        fragsh = loadShader(fnfrag, GL_FRAGMENT_SHADER)
+        vertsh = compileShader(vertsource, GL_VERTEX_SHADER)
+        fragsh = compileShader(fragsource, GL_FRAGMENT_SHADER)
 
+        if cachefile is not None:
+            glProgramParameteri(prog, GL_PROGRAM_BINARY_RETRIEVABLE_HINT, GL_TRUE)
         glAttachShader(prog, vertsh)
         glAttachShader(prog, fragsh)
         glLinkProgram(prog)
@@ -78,6 +175,13 @@ def createProgram(fnvert, fnfrag):
         vertsh = None
         glDeleteShader(fragsh)
         fragsh = None
+
+        if cachefile is not None:
+            try:
+                saveProgramBinary(prog, cachefile)
+            except (IOError, OSError):
+                # The program works without its cache entry
+                pass
         
         return prog
     except Exception as e:
@@ -0,0 +1,203 @@
+##############################################################################
+# This software is licensed under a modified MIT license. The MIT license itself
+# is unchanged, we have only added an optional beerware clause (based off of
+# Poul-Henning Kamp's Beerware license). That is to say, you have the option
+# of completely disregarding the beerware clause and using this software under
+# the vanilla MIT license if you so wish.
+#
+# Copyright (c) 2013 Chris Gibson
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
+# Optional beerware clause:
+# If we happen to meet in person someday and you think this software is worth
+# it, you are welcome to buy us a round of beers. This clause is entirely
+# optional, and need not be fulfilled for you to fully comply with the terms
+# of this license.
+##############################################################################
+
+import numpy as np
+
+from refine import Refinement, WEIGHTS, segmentSum
+
+
+# A sparse table of stencils: every refined vertex is a weighted sum of the
+# cage vertices. Stored row by row, the stencil of row i being
+# columns[start[i]:start[i+1]] weighted by weights[start[i]:start[i+1]].
+#
+# Compile a table once for a fixed cage topology, then evaluate() it for any
+# number of cage positions without redoing the topology work.
+class StencilTable(object):
+
+    def __init__(self, start, columns, weights, columnCount, quads=None):
+        self.start = start
+        self.columns = columns
+        self.weights = weights
+        self.rowCount = len(start) - 1
+        self.columnCount = columnCount
+
+        # The refined quads the rows are vertices of, if known
+        self.quads = quads
+
+    # Build a table from (row, column, weight) entries, summing any duplicates
+    @classmethod
+    def fromEntries(cls, rows, columns, weights, rowCount, columnCount):
+        keys, inverse = np.unique(np.asarray(rows, dtype=np.int64) * columnCount + columns,
+                                  return_inverse=True)
+        weights = np.bincount(inverse.ravel(), weights=weights, minlength=len(keys))
+
+        keep = weights != 0
+        keys = keys[keep]
+
+        start = np.zeros(rowCount + 1, dtype=np.int64)
+        np.cumsum(np.bincount(keys // columnCount, minlength=rowCount), out=start[1:])
+        return cls(start, keys % columnCount, weights[keep], columnCount)
+
+    # Compile the stencils of the given number of catmull-clark levels over a
+    # quad topology with vertexCount cage vertices
+    @classmethod
+    def compile(cls, quads, vertexCount, levels, technique=2):
+        quads = np.asarray(quads, dtype=np.int64).reshape(-1, 4)
+
+        table = cls.identity(vertexCount)
+        for level in range(levels):
+            refinement = Refinement(quads, table.rowCount)
+            table = levelStencils(refinement, technique).compose(table)
+            quads = refinement.refinedQuads()
+
+        table.quads = quads
+        return table
+
+    # A table that maps every vertex to itself
+    @classmethod
+    def identity(cls, count):
+        return cls(np.arange(count + 1, dtype=np.int64), np.arange(count, dtype=np.int64),
+                   np.ones(count), count)
+
+    # The row every entry belongs to
+    def entryRows(self):
+        return np.repeat(np.arange(self.rowCount), np.diff(self.start))
+
+    # Return the table mapping every column to the rows that use it, with the
+    # same weights. Row i of the transpose lists the refined vertices cage
+    # vertex i moves
+    def transpose(self):
+        return StencilTable.fromEntries(self.columns, self.entryRows(), self.weights,
+                                        self.columnCount, self.rowCount)
+
+    # Return the entries of the given rows, as positions into columns and
+    # weights, and an array of len(rows)+1 offsets splitting them by row
+    def rowEntries(self, rows):
+        rows = np.asarray(rows, dtype=np.int64)
+        counts = np.diff(self.start)[rows]
+        offsets = np.zeros(len(rows) + 1, dtype=np.int64)
+        np.cumsum(counts, out=offsets[1:])
+
+        pos = np.repeat(self.start[rows] - offsets[:-1], counts) + np.arange(offsets[-1])
+        return pos, offsets
+
+    # Return the table of self applied after inner, so that
+    # self.compose(inner).evaluate(p) == self.evaluate(inner.evaluate(p))
+    def compose(self, inner):
+        if self.columnCount != inner.rowCount:
+            raise ValueError("cannot compose %s columns with %s rows" %
+                             (self.columnCount, inner.rowCount))
+
+        # Expand every entry of self into the stencil of the inner row it names
+        counts = np.diff(inner.start)[self.columns]
+        total = counts.sum()
+        offsets = np.arange(total) - np.repeat(np.cumsum(counts) - counts, counts)
+        pos = np.repeat(inner.start[self.columns], counts) + offsets
+
+        return StencilTable.fromEntries(np.repeat(self.entryRows(), counts),
+                                        inner.columns[pos],
+                                        np.repeat(self.weights, counts) * inner.weights[pos],
+                                        self.rowCount, inner.columnCount)
+
+    # Evaluate the refined vertices for an (N, ...) array of cage positions
+    def evaluate(self, points):
+        points = np.asarray(points, dtype=np.float64)
+        if len(points) != self.columnCount:
+            raise ValueError("expected %s cage vertices, got %s" % (self.columnCount, len(points)))
+
+        weights = self.weights.reshape((-1,) + (1,) * (points.ndim - 1))
+        return segmentSum(weights * points[self.columns], self.start)
+
+    # Evaluate only the given rows for an (N, ...) array of cage positions
+    def evaluateRows(self, points, rows):
+        points = np.asarray(points, dtype=np.float64)
+        pos, offsets = self.rowEntries(rows)
+
+        weights = self.weights[pos].reshape((-1,) + (1,) * (points.ndim - 1))
+        return segmentSum(weights * points[self.columns[pos]], offsets)
+
+
+# Return the stencils of a single catmull-clark step, mapping the vertices of a
+# level to those of the next. These follow the same steps as Refinement.apply
+def levelStencils(refinement, technique=2):
+    quads = refinement.quads
+    edges = refinement.edges
+    edgeQuads = refinement.edgeQuads
+    vertexCount = refinement.vertexCount
+    faceCount = len(quads)
+    faceStart = vertexCount
+    edgeStart = vertexCount + faceCount
+
+    rows = []
+    cols = []
+    weights = []
+
+    def add(r, c, w):
+        r, c, w = np.broadcast_arrays(r, c, w)
+        rows.append(r.ravel())
+        cols.append(c.ravel())
+        weights.append(w.ravel().astype(np.float64))
+
+    # STEP ONE: face points average the four corners
+    add(faceStart + np.arange(faceCount)[:, None], quads, 0.25)
+
+    # STEP TWO: edge points average the end points and the two face points
+    edgeRows = edgeStart + np.arange(refinement.edgeCount)[:, None]
+    add(edgeRows, edges, 0.25)
+    add(edgeRows, quads[edgeQuads[:, 0]], 1.0 / 16.0)
+    add(edgeRows, quads[edgeQuads[:, 1]], 1.0 / 16.0)
+
+    # STEP THREE: old vertices blend their old position with the average face
+    # and edge points around them. Vertices no quad uses stay where they are
+    valence = refinement.valence
+    used = valence > 0
+    n = np.maximum(valence, 1).astype(np.float64)
+    edgeCount = np.maximum(np.diff(refinement.vertexEdgeStart), 1).astype(np.float64)
+    w1, w2, w3 = WEIGHTS[technique](n)
+
+    add(np.arange(vertexCount), np.arange(vertexCount), np.where(used, w1, 1.0))
+
+    vertRows = np.repeat(np.arange(vertexCount), valence)
+    add(vertRows[:, None], quads[refinement.vertexQuads], (w2 / n)[vertRows, None] * 0.25)
+
+    edgeVerts = np.repeat(np.arange(vertexCount), np.diff(refinement.vertexEdgeStart))
+    edgeWeights = (w3 / edgeCount)[edgeVerts, None]
+    vertEdges = refinement.vertexEdges
+    add(edgeVerts[:, None], edges[vertEdges], edgeWeights * 0.25)
+    add(edgeVerts[:, None], quads[edgeQuads[vertEdges, 0]], edgeWeights / 16.0)
+    add(edgeVerts[:, None], quads[edgeQuads[vertEdges, 1]], edgeWeights / 16.0)
+
+    return StencilTable.fromEntries(np.concatenate(rows), np.concatenate(cols),
+                                    np.concatenate(weights),
+                                    refinement.refinedVertexCount(), vertexCount)
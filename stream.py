@@ -0,0 +1,290 @@
+##############################################################################
+# This software is licensed under a modified MIT license. The MIT license itself
+# is unchanged, we have only added an optional beerware clause (based off of
+# Poul-Henning Kamp's Beerware license). That is to say, you have the option
+# of completely disregarding the beerware clause and using this software under
+# the vanilla MIT license if you so wish.
+#
+# Copyright (c) 2013 Chris Gibson
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
+# Optional beerware clause:
+# If we happen to meet in person someday and you think this software is worth
+# it, you are welcome to buy us a round of beers. This clause is entirely
+# optional, and need not be fulfilled for you to fully comply with the terms
+# of this license.
+##############################################################################
+
+import os
+import shutil
+import tempfile
+
+import numpy as np
+
+from refine import WEIGHTS
+
+
+# Rough working memory per element of each pass, used to size the chunks so
+# that the arrays of one chunk fit the memory budget
+_BYTES_PER_QUAD = 512
+_BYTES_PER_EDGE = 256
+_BYTES_PER_VERTEX = 256
+
+
+# Return the vertex and quad file names of a mesh stored under the given prefix
+def meshPaths(prefix):
+    return prefix + '.verts.npy', prefix + '.quads.npy'
+
+
+# Write (N, 3) vertices and (F, 4) quads as .npy files under the given prefix
+def saveArrays(prefix, verts, quads):
+    vertPath, quadPath = meshPaths(prefix)
+    np.save(vertPath, np.asarray(verts))
+    np.save(quadPath, np.asarray(quads))
+
+
+# Open the vertex and quad files under the given prefix as memory maps. Pass
+# them to SubdMesh.fromArrays to get a mesh back
+def loadArrays(prefix):
+    vertPath, quadPath = meshPaths(prefix)
+    return np.load(vertPath, mmap_mode='r'), np.load(quadPath, mmap_mode='r')
+
+
+# Yield (lo, hi) ranges covering range(count) in steps of at most size
+def _ranges(count, size):
+    for lo in range(0, count, size):
+        yield lo, min(lo + size, count)
+
+
+# Subdivide a mesh stored on disk without ever holding it in memory.
+#
+# The mesh under inPrefix (see saveArrays) is read and the refined mesh is
+# written under outPrefix, the given number of levels down. Every level streams
+# through its input in chunks sized so that the working arrays stay within
+# memoryBudget bytes; everything the size of the mesh lives in memory-mapped
+# scratch files in scratchDir (or the system temp directory).
+#
+# The refined surface is the same as SubdMesh.subdivide gives, but edge points
+# are numbered in the order their edges are met going from the smaller to the
+# larger vertex index, so they may be stored in a different order.
+def subdivideFiles(inPrefix, outPrefix, levels=1, technique=2,
+                   memoryBudget=64 * 1024 * 1024, scratchDir=None):
+    scratch = tempfile.mkdtemp(prefix='subdiv-', dir=scratchDir)
+    try:
+        current = inPrefix
+        for level in range(levels):
+            if level == levels - 1:
+                target = outPrefix
+            else:
+                target = os.path.join(scratch, 'level%d' % (level + 1))
+
+            _subdivideLevel(current, target, technique, memoryBudget,
+                            os.path.join(scratch, 'work'))
+
+            # The previous scratch level is no longer needed
+            if current != inPrefix:
+                for path in meshPaths(current):
+                    os.remove(path)
+            current = target
+    finally:
+        shutil.rmtree(scratch, ignore_errors=True)
+
+
+# Subdivide one level from file to file
+def _subdivideLevel(inPrefix, outPrefix, technique, memoryBudget, work):
+    verts, quads = loadArrays(inPrefix)
+    vertexCount = len(verts)
+    faceCount = len(quads)
+
+    if not os.path.isdir(work):
+        os.makedirs(work)
+
+    def scratch(name, shape, dtype):
+        return np.lib.format.open_memmap(os.path.join(work, name + '.npy'), mode='w+',
+                                         dtype=dtype, shape=shape)
+
+    quadChunk = max(1, memoryBudget // _BYTES_PER_QUAD)
+    edgeChunk = max(1, memoryBudget // _BYTES_PER_EDGE)
+    vertexChunk = max(1, memoryBudget // _BYTES_PER_VERTEX)
+
+    # PASS ONE: count the quads around every vertex, and the edges every vertex
+    # owns. An edge is owned by its smaller vertex and numbered when it is met
+    # running from the smaller to the larger vertex. On a closed mesh every
+    # edge is met exactly once that way
+    # -----------------------------------------------------------
+    valence = scratch('valence', (vertexCount,), np.int64)
+    ownCount = scratch('ownCount', (vertexCount,), np.int64)
+    edgeCount = 0
+
+    for lo, hi in _ranges(faceCount, quadChunk):
+        q = np.asarray(quads[lo:hi], dtype=np.int64)
+        a = q.ravel()
+        b = np.roll(q, -1, axis=1).ravel()
+        owned = a < b
+
+        np.add.at(valence, a, 1)
+        np.add.at(ownCount, a[owned], 1)
+        edgeCount += int(owned.sum())
+
+    if 2 * edgeCount != 4 * faceCount:
+        raise ValueError("mesh is not closed: every edge must border exactly two quads")
+
+    # The edges owned by vertex v are listed in ownHi/ownId[ownStart[v]:ownStart[v+1]]
+    ownStart = scratch('ownStart', (vertexCount + 1,), np.int64)
+    ownStart[0] = 0
+    np.cumsum(ownCount, out=ownStart[1:])
+    maxOwned = max([int(ownCount[lo:hi].max()) for lo, hi in _ranges(vertexCount, vertexChunk)] or [0])
+
+    ownHi = scratch('ownHi', (edgeCount,), np.int64)
+    ownId = scratch('ownId', (edgeCount,), np.int64)
+    ownFill = scratch('ownFill', (vertexCount,), np.int64)
+    edges = scratch('edges', (edgeCount, 2), np.int64)
+    halfEdges = scratch('halfEdges', (faceCount, 4), np.int64)
+
+    # PASS TWO: number the owned edges and file them under their owner
+    # -----------------------------------------------------------
+    nextEdge = 0
+    for lo, hi in _ranges(faceCount, quadChunk):
+        q = np.asarray(quads[lo:hi], dtype=np.int64)
+        a = q.ravel()
+        b = np.roll(q, -1, axis=1).ravel()
+        owned = np.nonzero(a < b)[0]
+
+        ids = nextEdge + np.arange(len(owned))
+        nextEdge += len(owned)
+
+        he = np.full(len(a), -1, dtype=np.int64)
+        he[owned] = ids
+        halfEdges[lo:hi] = he.reshape(-1, 4)
+        edges[ids, 0] = a[owned]
+        edges[ids, 1] = b[owned]
+
+        # Several edges of the chunk may share an owner, give each its own slot
+        order = np.argsort(a[owned], kind='mergesort')
+        owners = a[owned][order]
+        groupFirst = np.searchsorted(owners, owners, side='left')
+        slots = ownStart[owners] + ownFill[owners] + (np.arange(len(owners)) - groupFirst)
+
+        ownHi[slots] = b[owned][order]
+        ownId[slots] = ids[order]
+
+        uniqueOwners, counts = np.unique(owners, return_counts=True)
+        ownFill[uniqueOwners] += counts
+
+    # PASS THREE: find the edge of every half edge running the other way
+    # -----------------------------------------------------------
+    for lo, hi in _ranges(faceCount, quadChunk):
+        he = np.array(halfEdges[lo:hi]).ravel()
+        q = np.asarray(quads[lo:hi], dtype=np.int64)
+        twin = np.nonzero(he < 0)[0]
+
+        owner = np.roll(q, -1, axis=1).ravel()[twin]
+        other = q.ravel()[twin]
+        first = ownStart[owner]
+        count = ownCount[owner]
+
+        for k in range(maxOwned):
+            match = (k < count) & (he[twin] < 0)
+            slot = first[match] + k
+            found = np.asarray(ownHi[slot]) == other[match]
+            he[twin[match][found]] = ownId[slot[found]]
+
+        if np.any(he < 0):
+            raise ValueError("mesh is not closed: every edge must border exactly two quads")
+
+        halfEdges[lo:hi] = he.reshape(-1, 4)
+
+    # Refined vertices: the moved old vertices, then face points, then edge points
+    refinedCount = vertexCount + faceCount + edgeCount
+    outVertPath, outQuadPath = meshPaths(outPrefix)
+    outVerts = np.lib.format.open_memmap(outVertPath, mode='w+', dtype=verts.dtype,
+                                         shape=(refinedCount, 3))
+    faceStart = vertexCount
+    edgeStart = vertexCount + faceCount
+
+    # STEP ONE: face points, gathered into their edges and vertices as we go
+    # -----------------------------------------------------------
+    edgeSum = scratch('edgeSum', (edgeCount, 3), np.float64)
+    faceSum = scratch('faceSum', (vertexCount, 3), np.float64)
+
+    for lo, hi in _ranges(faceCount, quadChunk):
+        q = np.asarray(quads[lo:hi], dtype=np.int64)
+        facePts = np.asarray(verts[q.ravel()], dtype=np.float64).reshape(-1, 4, 3).mean(axis=1)
+        outVerts[faceStart + lo:faceStart + hi] = facePts
+
+        cornerPts = np.repeat(facePts, 4, axis=0)
+        np.add.at(edgeSum, np.asarray(halfEdges[lo:hi]).ravel(), cornerPts)
+        np.add.at(faceSum, q.ravel(), cornerPts)
+
+    # STEP TWO: edge points, gathered into their end points as we go
+    # -----------------------------------------------------------
+    edgePtSum = scratch('edgePtSum', (vertexCount, 3), np.float64)
+    edgeValence = scratch('edgeValence', (vertexCount,), np.int64)
+
+    for lo, hi in _ranges(edgeCount, edgeChunk):
+        e = np.asarray(edges[lo:hi])
+        ends = np.asarray(verts[e.ravel()], dtype=np.float64).reshape(-1, 2, 3).sum(axis=1)
+        edgePts = (edgeSum[lo:hi] + ends) / 4.0
+        outVerts[edgeStart + lo:edgeStart + hi] = edgePts
+
+        np.add.at(edgePtSum, e[:, 0], edgePts)
+        np.add.at(edgePtSum, e[:, 1], edgePts)
+        np.add.at(edgeValence, e.ravel(), 1)
+
+    # STEP THREE: move the old vertices. Vertices no quad uses are left alone
+    # -----------------------------------------------------------
+    for lo, hi in _ranges(vertexCount, vertexChunk):
+        old = np.array(verts[lo:hi], dtype=np.float64)
+        n = np.asarray(valence[lo:hi], dtype=np.float64)[:, None]
+        m = np.asarray(edgeValence[lo:hi], dtype=np.float64)[:, None]
+        used = n[:, 0] > 0
+
+        w1, w2, w3 = WEIGHTS[technique](n[used])
+        old[used] = (w1 * old[used] +
+                     w2 * (faceSum[lo:hi][used] / n[used]) +
+                     w3 * (edgePtSum[lo:hi][used] / m[used]))
+        outVerts[lo:hi] = old
+
+    # STEP FOUR: new quads
+    # -----------------------------------------------------------
+    quadType = quads.dtype
+    if refinedCount > np.iinfo(quadType).max:
+        quadType = np.int64
+    outQuads = np.lib.format.open_memmap(outQuadPath, mode='w+', dtype=quadType,
+                                         shape=(4 * faceCount, 4))
+
+    for lo, hi in _ranges(faceCount, quadChunk):
+        q = np.asarray(quads[lo:hi], dtype=np.int64)
+        edgePtIdx = edgeStart + np.asarray(halfEdges[lo:hi])
+
+        newQuads = np.empty((hi - lo, 4, 4), dtype=np.int64)
+        newQuads[:, :, 0] = (faceStart + np.arange(lo, hi))[:, None]
+        newQuads[:, :, 1] = np.roll(edgePtIdx, 1, axis=1)
+        newQuads[:, :, 2] = q
+        newQuads[:, :, 3] = edgePtIdx
+        outQuads[4 * lo:4 * hi] = newQuads.reshape(-1, 4)
+
+    outVerts.flush()
+    outQuads.flush()
+
+    # Drop the scratch maps before their files go
+    del valence, ownCount, ownStart, ownHi, ownId, ownFill, edges, halfEdges
+    del edgeSum, faceSum, edgePtSum, edgeValence
+    shutil.rmtree(work, ignore_errors=True)
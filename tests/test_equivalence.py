@@ -0,0 +1,197 @@
+##############################################################################
+# This software is licensed under a modified MIT license. The MIT license itself
+# is unchanged, we have only added an optional beerware clause (based off of
+# Poul-Henning Kamp's Beerware license). That is to say, you have the option
+# of completely disregarding the beerware clause and using this software under
+# the vanilla MIT license if you so wish.
+#
+# Copyright (c) 2013 Chris Gibson
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
+# Optional beerware clause:
+# If we happen to meet in person someday and you think this software is worth
+# it, you are welcome to buy us a round of beers. This clause is entirely
+# optional, and need not be fulfilled for you to fully comply with the terms
+# of this license.
+##############################################################################
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+import meshio
+import stream
+from adaptive import refineAdaptive
+from cache import SubdivisionCache
+from deform import Deformer, Scale, Twist
+from incremental import IncrementalSubdivision
+from limit import projectToLimit
+from mesh import SubdMesh
+from refine import Refinement
+from stencil import StencilTable
+
+
+# The exact equivalences between the subdivision code paths: every engine,
+# table and cache has to give what plain uniform subdivision gives.
+
+
+# Return the cube cage as float64 vertices and quads
+def cubeArrays():
+    cube = SubdMesh.buildCube()
+    return np.array(cube.vertexArray(), dtype=np.float64), np.array(cube.quadArray())
+
+
+# Return the (verts, quads) of subdividing with the numpy engine
+def uniform(verts, quads, levels):
+    msh = SubdMesh.fromArrays(verts, quads)
+    for i in range(levels):
+        msh.subdivide(engine='numpy')
+    return np.array(msh.vertexArray()), np.array(msh.quadArray())
+
+
+# Return a mesh as a sorted list of quads given by their rounded corner
+# positions, for comparing meshes whose vertices are stored in another order
+def canonical(verts, quads):
+    verts = np.round(np.asarray(verts, dtype=np.float64), 9)
+    return sorted(tuple(sorted(tuple(verts[i]) for i in quad)) for quad in np.asarray(quads))
+
+
+class SubdivisionTest(unittest.TestCase):
+
+    def testNumpyEngineMatchesPython(self):
+        verts, quads = cubeArrays()
+        msh = SubdMesh.fromArrays(verts, quads)
+        for i in range(3):
+            msh.subdivide(engine='python')
+
+        refinedVerts, refinedQuads = uniform(verts, quads, 3)
+        np.testing.assert_allclose(msh.vertexArray(), refinedVerts, atol=1e-12)
+        np.testing.assert_array_equal(msh.quadArray(), refinedQuads)
+
+    def testParallelEngineMatchesNumpy(self):
+        verts, quads = cubeArrays()
+        msh = SubdMesh.fromArrays(verts, quads)
+        for i in range(2):
+            msh.subdivide(engine='parallel', workers=2)
+
+        refinedVerts, refinedQuads = uniform(verts, quads, 2)
+        np.testing.assert_allclose(msh.vertexArray(), refinedVerts, atol=1e-12)
+        np.testing.assert_array_equal(msh.quadArray(), refinedQuads)
+
+    def testStencilTableMatchesSubdivide(self):
+        verts, quads = cubeArrays()
+        table = StencilTable.compile(quads, len(verts), 3)
+
+        refinedVerts, refinedQuads = uniform(verts, quads, 3)
+        np.testing.assert_allclose(table.evaluate(verts), refinedVerts, atol=1e-12)
+        np.testing.assert_array_equal(table.quads, refinedQuads)
+
+    def testAdaptiveAtToleranceZeroMatchesUniform(self):
+        verts, quads = cubeArrays()
+        refinedVerts, refinedQuads = refineAdaptive(verts, quads, 0)[:2]
+
+        refinement = Refinement(quads, len(verts))
+        np.testing.assert_allclose(refinedVerts, refinement.apply(verts), atol=1e-12)
+        np.testing.assert_array_equal(refinedQuads, refinement.refinedQuads())
+
+    def testIncrementalMatchesFullRebuild(self):
+        verts, quads = cubeArrays()
+        incremental = IncrementalSubdivision(verts, quads, levels=2)
+        incremental.moveVertices([3, 5], [[2.0, 1.0, 0.5], [-1.0, 0.0, 1.5]])
+
+        moved = verts.copy()
+        moved[3] = [2.0, 1.0, 0.5]
+        moved[5] = [-1.0, 0.0, 1.5]
+        refinedVerts, refinedQuads = uniform(moved, quads, 2)
+        np.testing.assert_allclose(incremental.verts, refinedVerts, atol=1e-12)
+        np.testing.assert_allclose(incremental.buffer[:, :3], refinedVerts.astype(np.float32), atol=1e-12)
+        np.testing.assert_array_equal(incremental.quads, refinedQuads)
+
+    def testLimitMatchesEvaluatorCorners(self):
+        verts, quads = cubeArrays()
+        evaluator = SubdMesh.fromArrays(verts, quads).limitEvaluator()
+        positions = evaluator.evaluate(np.arange(len(quads)), 0.0, 0.0)[0]
+        np.testing.assert_allclose(positions, projectToLimit(verts, quads, 4)[quads[:, 0]], atol=1e-12)
+
+
+class StorageTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def testMeshFileRoundTrip(self):
+        verts, quads = uniform(*cubeArrays(), levels=2)
+        path = os.path.join(self.directory, 'cube.mesh')
+        SubdMesh.fromArrays(verts, quads).save(path)
+
+        loaded = SubdMesh.load(path)
+        np.testing.assert_array_equal(loaded.vertexArray(), verts.astype(np.float32))
+        np.testing.assert_array_equal(loaded.quadArray(), quads)
+        np.testing.assert_array_equal(meshio.load(path)[1], quads)
+
+    def testStreamedMatchesInMemory(self):
+        verts, quads = cubeArrays()
+        stream.saveArrays(os.path.join(self.directory, 'cage'), verts, quads)
+        stream.subdivideFiles(os.path.join(self.directory, 'cage'), os.path.join(self.directory, 'out'),
+                              levels=2, memoryBudget=4096, scratchDir=self.directory)
+
+        streamedVerts, streamedQuads = stream.loadArrays(os.path.join(self.directory, 'out'))
+        self.assertEqual(canonical(streamedVerts, streamedQuads), canonical(*uniform(verts, quads, 2)))
+
+    def testCacheMatchesSubdivide(self):
+        verts, quads = cubeArrays()
+        refinedVerts, refinedQuads = uniform(verts, quads, 2)
+
+        cache = SubdivisionCache(directory=os.path.join(self.directory, 'cache'))
+        for i in range(2):
+            cachedVerts, cachedQuads = cache.subdivide(verts, quads, 2)
+            np.testing.assert_allclose(cachedVerts, refinedVerts, atol=1e-12)
+            np.testing.assert_array_equal(cachedQuads, refinedQuads)
+        self.assertEqual((cache.misses, cache.hits), (1, 1))
+
+        # A new cache maps the files written by the first
+        cache = SubdivisionCache(directory=os.path.join(self.directory, 'cache'))
+        cachedVerts, cachedQuads = cache.subdivide(verts, quads, 2)
+        np.testing.assert_allclose(cachedVerts, refinedVerts, atol=1e-12)
+        np.testing.assert_array_equal(cachedQuads, refinedQuads)
+        self.assertEqual(cache.diskHits, 1)
+
+
+class DeformTest(unittest.TestCase):
+
+    def testPipelineMatchesStagesInOrder(self):
+        verts = cubeArrays()[0]
+        piped = verts.copy()
+        Deformer().then(Scale(2.0)).then(Twist(0.5)).apply(piped)
+
+        staged = verts.copy()
+        Scale(2.0).apply(staged)
+        Twist(0.5).apply(staged)
+        np.testing.assert_allclose(piped, staged, atol=1e-12)
+
+
+if __name__ == '__main__':
+    unittest.main()